@@ -26,14 +26,25 @@ import sys
 from os import path, getenv
 import os
 import time
+import threading
 import argparse
 from flask import Flask, request, Response, render_template
 import json
-from itertools import cycle
+import re
+import marshal
+import hashlib
+import zlib
+import operator
+import bisect
+from array import array
+from itertools import cycle, count
+from collections import deque
 
 # if PAPARAZZI_SRC not set, then assume the tree containing this file is a reasonable substitute
 PPRZ_SRC = getenv("PAPARAZZI_SRC", path.normpath(path.join(path.dirname(path.abspath(__file__)), '~/paparazzi/')))
 
+PPRZ_HOME = getenv("PAPARAZZI_HOME", PPRZ_SRC)
+
 sys.path.append(PPRZ_SRC + "/sw/lib/python")
 sys.path.append(PPRZ_SRC + "/sw/ext/pprzlink/lib/v1.0/python")
 
@@ -41,7 +52,12 @@ from pprzlink.ivy       import IvyMessagesInterface
 from pprzlink.message   import PprzMessage
 from settings_xml_parse import PaparazziACSettings
 
-from math import radians
+from math import radians, sin, cos, sqrt
+
+try:
+    import numpy   # Optional, used by the formation routes
+except ImportError:
+    numpy = None
 
 
 app = Flask(__name__)
@@ -61,6 +77,9 @@ frc_version   = "0.3.5"
 verbose       = 0              # Default is disabled(i.e. = 0)
 curl          = 0              # Default is disabled(i.e. = 0)
 subscribe     = 0              # Default is disabled(i.e. = 0)
+stream_tick   = 0.5            # Default status stream tick interval in seconds
+history_depth = 600            # Default number of samples kept per message in the telemetry history
+history_cap   = 16             # Default memory cap of the telemetry history in MB
 server_host   = "127.0.0.1"    # Default to local host)
 server_port   = 5000           # Default it flask port)
 
@@ -74,13 +93,71 @@ class Status(object):
         self.st_msg_key  = st_msg_key
         self.st_msg_val  = None
 
-class Message(PprzMessage):
+health_alpha   = 0.1   # Weight of the latest receive interval in the average receive interval
+health_dropout = 3.0   # A receive gap longer than this many average intervals counts as a dropout
+health_min_gap = 0.5   # Gaps shorter than this many seconds are never counted as dropouts
+
+class Message(object):
+    # Per aircraft, per message record; created on first receipt and updated in place afterwards
+    __slots__ = ('msg_class', 'name', 'fieldnames', 'field_values', 'json', 'last_seen', 'latest_msg',
+                 'count', 'interval', 'dropouts', 'version')
+
     def __init__(self, class_name, name, msg):
-        super(Message, self).__init__(class_name, name)
-        self.field_controls = {}
-        self.index          = None
-        self.last_seen      = time.clock()
-        self.latest_msg     = msg
+        self.msg_class    = class_name
+        self.name         = name
+        self.fieldnames   = tuple(msg.fieldnames)
+        self.field_values = {}       # Decoded field table(field name -> value), refreshed on every received message
+        self.json         = None     # (message, serialized message) of the last read, reused until the next message
+        self.last_seen    = None
+        self.latest_msg   = None
+        self.count        = 0        # Number of received messages
+        self.interval     = None     # Exponentially weighted average receive interval in seconds
+        self.dropouts     = 0        # Number of receive gaps longer than expected
+        self.version      = 0        # Odd while the ivy thread updates the record, see read()
+
+    def update(self, msg, timestamp):
+        self.version += 1
+        field_values = self.field_values
+        values       = msg.fieldvalues
+        for index, fieldname in enumerate(self.fieldnames):
+            field_values[fieldname] = values[index]
+        self.latest_msg = msg
+        if self.last_seen is not None:
+            gap = timestamp - self.last_seen
+            if self.interval is None:
+                self.interval = gap
+            else:
+                if gap > health_min_gap and gap > health_dropout*self.interval:
+                    self.dropouts += 1
+                self.interval += health_alpha*(gap - self.interval)
+        self.last_seen  = timestamp
+        self.count     += 1
+        self.version   += 1
+
+    def read(self, reader):
+        # Seqlock style consistent read: retry if the record was updated meanwhile, never block the ivy thread
+        while True:
+            version = self.version
+            if version % 2 == 0:
+                result = reader(self)
+                if self.version == version:
+                    return result
+            time.sleep(0)
+
+    def rate(self):
+        return 1.0/self.interval if self.interval else 0.0
+
+    def is_stale(self, now):
+        # Stale once the message is overdue by the same margin that counts as a dropout(assume 1 Hz until known)
+        interval = self.interval if self.interval is not None else 1.0
+        return now - self.last_seen > max(health_min_gap, health_dropout*interval)
+
+    def health(self, now):
+        return self.read(lambda message: { 'count':    message.count,
+                                           'rate':     round(message.rate(), 3),
+                                           'age':      round(now - message.last_seen, 3),
+                                           'dropouts': message.dropouts,
+                                           'stale':    message.is_stale(now) })
 
 class Waypoint(object):
     def __init__(self, wp_id, wp_name, wp_x, wp_y):
@@ -103,14 +180,78 @@ class Flightblock(object):
         self.fb_id   = fb_id
         self.fb_name = fb_name
 
+wgs84_a  = 6378137.0                 # Meters, semi-major axis
+wgs84_f  = 1.0 / 298.257223563       # Flattening
+wgs84_e2 = wgs84_f * (2.0 - wgs84_f)   # First eccentricity squared
+
+class LocalFrame(object):
+    # Local east/north/up frame(meters) at the flight plan origin, converts to and from geodetic coordinates
+    # (degrees, meters). The origin is converted once; the conversions take numbers or numpy arrays.
+    def __init__(self, lat0, lon0, alt0):
+        self.lat0 = lat0
+        self.lon0 = lon0
+        self.alt0 = alt0
+        phi, lam  = radians(lat0), radians(lon0)
+        self.sin_lat, self.cos_lat = sin(phi), cos(phi)
+        self.sin_lon, self.cos_lon = sin(lam), cos(lam)
+        n = wgs84_a / sqrt(1.0 - wgs84_e2 * self.sin_lat**2)
+        self.ecef0 = ((n + alt0) * self.cos_lat * self.cos_lon,
+                      (n + alt0) * self.cos_lat * self.sin_lon,
+                      (n * (1.0 - wgs84_e2) + alt0) * self.sin_lat)
+
+    def to_geodetic(self, east, north, up):
+        x = self.ecef0[0] - self.sin_lon * east - self.sin_lat * self.cos_lon * north + self.cos_lat * self.cos_lon * up
+        y = self.ecef0[1] + self.cos_lon * east - self.sin_lat * self.sin_lon * north + self.cos_lat * self.sin_lon * up
+        z = self.ecef0[2] + self.cos_lat * north + self.sin_lat * up
+        # Bowring's closed form, millimeter accurate near the ground
+        b     = wgs84_a * (1.0 - wgs84_f)
+        p     = numpy.hypot(x, y)
+        theta = numpy.arctan2(z * wgs84_a, p * b)
+        phi   = numpy.arctan2(z + wgs84_e2 / (1.0 - wgs84_e2) * b * numpy.sin(theta)**3,
+                              p - wgs84_e2 * wgs84_a * numpy.cos(theta)**3)
+        alt   = p / numpy.cos(phi) - wgs84_a / numpy.sqrt(1.0 - wgs84_e2 * numpy.sin(phi)**2)
+        return numpy.degrees(phi), numpy.degrees(numpy.arctan2(y, x)), alt
+
+    def to_enu(self, lat, lon, alt):
+        phi, lam = numpy.radians(lat), numpy.radians(lon)
+        n  = wgs84_a / numpy.sqrt(1.0 - wgs84_e2 * numpy.sin(phi)**2)
+        dx = (n + alt) * numpy.cos(phi) * numpy.cos(lam) - self.ecef0[0]
+        dy = (n + alt) * numpy.cos(phi) * numpy.sin(lam) - self.ecef0[1]
+        dz = (n * (1.0 - wgs84_e2) + alt) * numpy.sin(phi) - self.ecef0[2]
+        return (-self.sin_lon * dx + self.cos_lon * dy,
+                -self.sin_lat * self.cos_lon * dx - self.sin_lat * self.sin_lon * dy + self.cos_lat * dz,
+                self.cos_lat * self.cos_lon * dx + self.cos_lat * self.sin_lon * dy + self.sin_lat * dz)
+
+class FlightPlan(object):
+    # Parsed once per flight plan file and shared by every aircraft flying it; not modified after parsing
+    def __init__(self, path, waypoints, flightblocks, reference=None):
+        self.path              = path
+        self.waypoints         = waypoints      # wp_id -> Waypoint
+        self.flightblocks      = flightblocks   # fb_id -> Flightblock
+        self.reference         = reference      # (lat0, lon0, ground_alt) of the flight plan, None if not given
+        self.frame             = LocalFrame(*reference) if reference is not None else None
+        self.waypoint_index    = {}             # wp_name -> wp_id, the first waypoint wins on duplicate names
+        self.flightblock_index = {}             # fb_name -> fb_id, the first flightblock wins on duplicate names
+        for wp_id in sorted(waypoints):
+            self.waypoint_index.setdefault(waypoints[wp_id].wp_name, wp_id)
+        for fb_id in sorted(flightblocks):
+            self.flightblock_index.setdefault(flightblocks[fb_id].fb_name, fb_id)
+
+empty_flightplan = FlightPlan(None, {}, {})   # Used by aircraft seen on the ivy bus but not defined in conf.xml
+
 class Aircraft(object):
-    def __init__(self, ac_id, name, color):
+    def __init__(self, ac_id, name, color, flightplan=empty_flightplan):
         self.ac_id        = ac_id
         self.name         = name
         self.color        = color
-        self.flightblocks = {}
-        self.waypoints    = {}
         self.messages     = {}
+        self.history      = {}   # message name -> MessageHistory, or None if the message has no history
+        self.set_flightplan(flightplan)
+
+    def set_flightplan(self, flightplan):
+        self.flightplan   = flightplan
+        self.flightblocks = flightplan.flightblocks
+        self.waypoints    = flightplan.waypoints
 
 class Layout(object):
     def __init__(self, name, rows, cols):
@@ -119,23 +260,55 @@ class Layout(object):
         self.cols         = cols
         
 
+# Shared state is read by the flask request threads and written by the ivy callback thread(telemetry) and the
+# client routes. Dicts and lists that change size are copy-on-write: writers build a new object and rebind it,
+# serialized by state_lock, so readers always iterate a complete snapshot without taking a lock. Exceptions,
+# changed in place on purpose:
+# - layout: a single slot(key 0), replaced by one assignment and never iterated
+# - telemetry_waiters: changed and iterated under telemetry_waiter_lock; the ivy callback only does lock free
+#   membership tests and gets, and copies a waiter list before walking it
+state_lock = threading.Lock()
+
 aircrafts = {}
+aircraft_names = {}   # aircraft name(conf.xml) -> ac_id, rebound together with aircrafts
 layout  = {}
 
-def add_new_aircraft_message( aircraft, msg_class, name, msg):
-    aircraft.messages[name] = Message(msg_class, name, msg)
-
-def add_new_aircraft_waypoint( aircraft, wp_id, wp_name, wp_x, wp_y):
-    aircraft.waypoints[wp_id] = Waypoint(wp_id, wp_name, wp_x, wp_y)      
-
-def add_new_aircraft_flightblock( aircraft, fb_id, fb_name):
-    aircraft.flightblocks[fb_id] = Flightblock(fb_id, fb_name)      
-
-def add_new_aircraft(ac_id, name, color):
-    aircrafts[ac_id] = Aircraft(ac_id, name, color)
+def add_new_aircraft_message( aircraft, msg_class, name, msg, timestamp):
+    message = Message(msg_class, name, msg)
+    # Decode the fields before the message becomes visible to the read routes; only the ivy thread adds messages
+    message.update(msg, timestamp)
+    messages = dict(aircraft.messages)
+    messages[name] = message
+    aircraft.messages = messages
+    return message
+
+def get_aircraft_message_json(message):
+    latest = message.latest_msg
+    cached = message.json
+    if cached is None or cached[0] is not latest:
+        cached = (latest, latest.to_json())
+        message.json = cached
+    return cached[1]
+
+def get_aircraft_message_value(ac_id, name, key):
+    # Returns the latest decoded field value as a string, or '' if unknown
+    if ac_id in aircrafts:
+        message = aircrafts[ac_id].messages.get(name)
+        if message is not None and key in message.field_values:
+            return str(message.field_values[key])
+    return ''
+
+def add_new_aircraft(ac_id, name, color, flightplan=empty_flightplan):
+    global aircrafts
+    with state_lock:
+        acs = dict(aircrafts)
+        acs[ac_id] = Aircraft(ac_id, name, color, flightplan)
+        aircrafts = acs
 
 def add_new_layout(name, rows, cols):
-    layout[0] = Layout(name, rows, cols)    
+    current = layout.get(0)
+    if current is None or (current.name, current.rows, current.cols) != (name, rows, cols):
+        layout[0] = Layout(name, rows, cols)    
 
 def print_aircraft_data():
     for ac_id in aircrafts:
@@ -207,41 +380,1360 @@ def generate_configuration_stub():
     print('</client>')
 
 
-aircraft_client_list       = []   # Used for rows in client; preserve list order
-flightblock_client_list    = []   # Used for columns in client view for flightblocks; preserve list order
-guided_client_list         = []   # Used for columns in client view for guided; preserve list order
-waypoint_client_list       = []   # Used for columns in client view for waypoints; preserve list order
-status_client_list           = []   # Used for columns in client view for status; preserve list order
-status_client_list_msg_name  = []   # Used for columns in client view for status; preserve list order
-status_client_list_msg_key   = []   # Used for columns in client view for status; preserve list order
-#fb_color_list              = ['lime', 'green', 'deepskyblue', 'dodgerblue', 'yellow', 'gold', 'orange', 'darkorange', 'orangered', 'red', 'darkred']
-#gd_color_list              = ['magenta', 'purple', 'deepskyblue', 'dodgerblue', 'lime', 'green', 'gold', 'orange', 'orangered', 'red']
-#wp_color_list              = ['deepskyblue', 'dodgerblue', 'lime', 'green', 'gold', 'orange', 'orangered', 'red']
+# --- Client view related state/methods
+
+class ViewItem(object):
+    __slots__ = ('item_id', 'name', 'color', 'label', 'icon', 'tooltip', 'msg_name', 'msg_key')
+
+    def __init__(self, item_id, name, color='white', label='', icon='', tooltip='', msg_name=None, msg_key=None):
+        self.item_id  = item_id
+        self.name     = name
+        self.color    = color
+        self.label    = label
+        self.icon     = icon
+        self.tooltip  = tooltip
+        self.msg_name = msg_name
+        self.msg_key  = msg_key
+
+    def styled(self, item_id, name, msg_name=None, msg_key=None):
+        # New item with this item's color/label/icon/tooltip, used for items added through the client routes
+        return ViewItem(item_id, name, self.color, self.label, self.icon, self.tooltip, msg_name, msg_key)
+
+
+class ClientView(object):
+    # Immutable; built once per change and rebound under state_lock, so a render always sees one consistent view
+    def __init__(self, items=()):
+        self.items     = tuple(items)
+        self.ids       = [ item.item_id for item in self.items ]   # Used for rows/columns in client; preserve list order
+        self.index     = dict( (item.item_id, position) for position, item in enumerate(self.items) )
+        self.msg_index = {}   # Used by the status stream; message name -> list of (column, message key)
+        for position, item in enumerate(self.items):
+            if item.msg_name:
+                self.msg_index.setdefault(item.msg_name, []).append((position, item.msg_key))
+        view = { 'ids':      self.ids,
+                 'names':    [ item.name for item in self.items ],
+                 'colors':   [ item.color for item in self.items ],
+                 'labels':   [ item.label for item in self.items ],
+                 'icons':    [ item.icon for item in self.items ],
+                 'tooltips': [ item.tooltip for item in self.items ] }
+        if self.msg_index:
+            view['msg_names'] = [ item.msg_name for item in self.items ]
+            view['msg_keys']  = [ item.msg_key for item in self.items ]
+        # Serialized once; escaped so it can be dropped straight into a <script> block
+        self.json = json.dumps(view, sort_keys=True).replace('<', '\\u003c').replace('>', '\\u003e').replace('&', '\\u0026')
+
+    def __len__(self):
+        return len(self.items)
+
+    def item(self, position):
+        # Attributes wrap around like the template cyclers did when there are more buttons than items
+        if self.items:
+            return self.items[position % len(self.items)]
+        return ViewItem(None, '')
+
+    def get(self, item_id):
+        position = self.index.get(item_id)
+        return self.items[position] if position is not None else None
+
+    def add(self, item):
+        return ClientView(self.items + (item,))
+
+def reuse_view(current, view):
+    # Keep the current view object when nothing changed, so pages and documents built from it stay cached
+    return current if current.json == view.json else view
+
+
+aircraft_view              = ClientView()   # Rows in all client views
+flightblock_view           = ClientView()   # Columns in client view for flightblocks
+guided_view                = ClientView()   # Columns in client view for guided, items have no id
+waypoint_view              = ClientView()   # Columns in client view for waypoints
+status_view                = ClientView()   # Columns in client view for status, items carry msg_name/msg_key
+
+
+# --- Aircraft settings cache related state/methods
+
+settings_cache = {}   # ac_id -> (settings.xml modification time, auto2 setting index)
+
+def get_settings_mtime(ac_id):
+    # PaparazziACSettings reads var/aircrafts/<name>/settings.xml; its mtime is used to invalidate the cache
+    try:
+        return os.path.getmtime(os.path.join(PPRZ_HOME, 'var', 'aircrafts', aircrafts[ac_id].name, 'settings.xml'))
+    except (KeyError, OSError):
+        return None
+
+def get_auto2_index(ac_id):
+    mtime = get_settings_mtime(ac_id)
+    entry = settings_cache.get(ac_id)
+    if entry is not None and entry[0] == mtime:
+        return entry[1]
+    try:
+        settings = PaparazziACSettings(ac_id)
+    except Exception as e:
+        print(e)
+        return None
+    try:
+        index = settings.name_lookup['auto2'].index
+    except Exception as e:
+        print(e)
+        print("auto2 setting not found, mode change not possible.")
+        return None
+    settings_cache[ac_id] = (mtime, index)
+    return index
 
-ac_color_list              = []   # Used by aircraft view color cycler
-ac_label_list              = []   # Used by aircraft view label cycler
-ac_icon_list               = []   # Used by aircraft view icon cycler
-ac_tooltip_list            = []   # Used by aircraft view tooltip cycler
 
-fb_color_list              = []   # Used by flight block view color cycler
-fb_label_list              = []   # Used by flight block view label cycler
-fb_icon_list               = []   # Used by flight block view icon cycler
-fb_tooltip_list            = []   # Used by flight block view tooltip cycler
+# --- Command message related methods
 
-gd_color_list              = []   # Used by guided view color cycler
-gd_label_list              = []   # Used by guided view label cycler
-gd_icon_list               = []   # Used by guided view icon cycler
-gd_tooltip_list            = []   # Used by guided view tooltip cycler
+def new_flightblock_message(ac_id, fb_id):
+    msg = PprzMessage("ground", "JUMP_TO_BLOCK")
+    msg['ac_id']    = ac_id
+    msg['block_id'] = fb_id
+    return msg
 
-wp_color_list              = []   # Used by waypoint view color cycler
-wp_label_list              = []   # Used by waypoint view label cycler
-wp_icon_list               = []   # Used by waypoint view icon cycler
-wp_tooltip_list            = []   # Used by waypoint view tooltip cycler
+def new_waypoint_message(ac_id, wp_id, lat, lon, alt):
+    msg = PprzMessage("ground", "MOVE_WAYPOINT")
+    msg['ac_id'] = ac_id
+    msg['wp_id'] = wp_id
+    msg['lat']   = lat
+    msg['long']  = lon
+    msg['alt']   = alt
+    return msg
+
+def new_guidance_message(ac_id, flag, x, y, z, yaw):
+    msg = PprzMessage("datalink", "GUIDED_SETPOINT_NED")
+    msg['ac_id'] = ac_id
+    msg['flags'] = flag
+    msg['x']     = x
+    msg['y']     = y
+    msg['z']     = z
+    msg['yaw']   = yaw
+    return msg
+
+def new_setting_message(ac_id, index, value):
+    msg = PprzMessage("ground", "DL_SETTING")
+    msg['ac_id'] = ac_id
+    msg['index'] = index
+    msg['value'] = value
+    return msg
+
+send_queue_size = 1000   # Maximum number of messages waiting for the ivy bus
+
+class SendQueue(object):
+    # Ivy messages are sent by a single worker thread in the order they were queued, so the commands for one
+    # aircraft keep their order; a guided setpoint replaces the previous one if that one is still queued and
+    # is the latest message queued for the aircraft
+    def __init__(self, size):
+        self.size        = size
+        self.condition   = threading.Condition()
+        self.queue       = deque()   # [message, time queued] entries
+        self.last        = {}        # ac_id -> latest queued entry for the aircraft
+        self.max_depth   = 0
+        self.sent        = 0
+        self.merged      = 0
+        self.rejected    = 0
+        self.errors      = 0
+        self.latency     = None      # Exponentially weighted time from queued to sent, seconds
+        self.latency_max = 0.0
+
+    def put(self, msglist, block=False, aborted=None):
+        # All or nothing: returns False without queueing anything if there is no room(and block is False), or if
+        # the aborted callable returns True while blocked
+        with self.condition:
+            while len(self.queue) + len(msglist) > self.size:
+                if not block or len(msglist) > self.size:
+                    self.rejected += len(msglist)
+                    return False
+                if aborted is None:
+                    self.condition.wait()
+                elif aborted():
+                    return False
+                else:
+                    self.condition.wait(0.2)   # Poll the abort request
+            now = time.time()
+            for msg in msglist:
+                ac_id = get_message_ac_id(msg)
+                entry = self.last.get(ac_id)
+                if msg.name == "GUIDED_SETPOINT_NED" and entry is not None and entry[0].name == "GUIDED_SETPOINT_NED":
+                    entry[0] = msg   # Superseded setpoint, keep its place in the queue
+                    self.merged += 1
+                    continue
+                entry = [msg, now]
+                self.queue.append(entry)
+                self.last[ac_id] = entry
+            self.max_depth = max(self.max_depth, len(self.queue))
+            self.condition.notify_all()
+        return True
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+                entry = self.queue.popleft()
+                ac_id = get_message_ac_id(entry[0])
+                if self.last.get(ac_id) is entry:
+                    del self.last[ac_id]
+                self.condition.notify_all()   # Wake up blocked producers
+            msg, queued = entry
+            if verbose: 
+                print_ivy_trace(msg)
+            sent = None
+            try:
+                if msg.msg_class == "datalink":
+                    ivy_interface.send_raw_datalink(msg)
+                else:
+                    ivy_interface.send(msg)
+                sent = time.time()
+                self.sent += 1
+            except Exception as e:
+                self.errors += 1
+                print(e)
+            latency = time.time() - queued
+            self.latency     = latency if self.latency is None else self.latency + 0.1 * (latency - self.latency)
+            self.latency_max = max(self.latency_max, latency)
+            if sent is not None:
+                command_tracer.sent(msg, sent)
+
+    def start(self):
+        thread = threading.Thread(target=self.run, name="SendQueue")
+        thread.daemon = True
+        thread.start()
+
+    def to_dict(self):
+        return {'depth': len(self.queue), 'size': self.size, 'max_depth': self.max_depth, 'sent': self.sent,
+                'merged': self.merged, 'rejected': self.rejected, 'errors': self.errors,
+                'latency_ms': round(self.latency * 1000.0, 3) if self.latency is not None else None,
+                'latency_max_ms': round(self.latency_max * 1000.0, 3)}
+
+send_queue = SendQueue(send_queue_size)
+
+def get_message_ac_id(msg):
+    try:
+        return msg['ac_id']
+    except Exception:
+        return None
+
+def send_message(msg, block=False):
+    # Returns False if the send queue is full
+    return send_queue.put([msg], block)
+
+def send_messages(msglist, block=False, aborted=None):
+    # Messages are built up front by the caller and queued together, so the aircraft receive them back to back
+    return send_queue.put(msglist, block, aborted)
+
+def send_queue_full():
+    return Response( "send queue full", status=503 )
+
+batch_fields = {   # Batch command message name -> (message builder, [(field name, field type)])
+    'JUMP_TO_BLOCK':       (new_flightblock_message, [('block_id', int)]),
+    'MOVE_WAYPOINT':       (new_waypoint_message,    [('wp_id', int), ('lat', float), ('long', float), ('alt', float)]),
+    'GUIDED_SETPOINT_NED': (new_guidance_message,    [('flags', int), ('x', float), ('y', float), ('z', float), ('yaw', float)]),
+    'DL_SETTING':          (new_setting_message,     [('index', int), ('value', float)]),
+}
+
+def new_batch_messages(commandlist):
+    # Validate every command before building any message; raises ValueError naming the offending command.
+    # A command without an ac_id applies to every client aircraft, a DL_SETTING without an index sets auto2.
+    commands = []
+    for idx, command in enumerate(commandlist):
+        if not isinstance(command, dict) or command.get('msg') not in batch_fields:
+            raise ValueError("command %d: unknown message, expected one of %s" % (idx, sorted(batch_fields)))
+        builder, fields = batch_fields[command['msg']]
+        if 'ac_id' in command:
+            try:
+                ac_ids = [int(command['ac_id'])]
+            except (TypeError, ValueError):
+                raise ValueError("command %d: invalid ac_id" % idx)
+            if ac_ids[0] not in aircrafts:
+                raise ValueError("command %d: unknown aircraft id %d" % (idx, ac_ids[0]))
+        else:
+            ac_ids = list(aircraft_view.ids)
+        values = []
+        for name, fieldtype in fields:
+            if name == 'index' and name not in command:
+                values.append(None)
+                continue
+            try:
+                values.append(fieldtype(command[name]))
+            except KeyError:
+                raise ValueError("command %d: missing %s" % (idx, name))
+            except (TypeError, ValueError):
+                raise ValueError("command %d: invalid %s" % (idx, name))
+        for ac_id in ac_ids:
+            acvalues = values
+            if values and values[0] is None:   # Only DL_SETTING has an optional(index) field
+                acvalues = [get_auto2_index(ac_id)] + values[1:]
+                if acvalues[0] is None:
+                    raise ValueError("command %d: auto2 setting not found for aircraft id %d" % (idx, ac_id))
+            commands.append( (builder, ac_id, acvalues) )
+    return [ builder(ac_id, *acvalues) for builder, ac_id, acvalues in commands ]
+
+
+# --- Guidance stream related state/methods
+
+guidance_rate = 10.0   # Maximum streamed guided setpoints sent per second and aircraft
+
+class GuidanceStream(object):
+    # Streamed guided setpoints are coalesced per aircraft: only the newest setpoint is kept, and a worker thread
+    # sends it once the aircraft's send period has elapsed
+    def __init__(self, rate):
+        self.rate      = rate
+        self.condition = threading.Condition()
+        self.pending   = {}   # ac_id -> (flags, x, y, z, yaw), newest setpoint not yet sent
+        self.due       = {}   # ac_id -> earliest time of the next send
+        self.received  = 0
+        self.coalesced = 0
+        self.sent      = 0
+        self.rejected  = 0    # Invalid setpoints
+        self.deferred  = 0    # Setpoints kept pending by a full send queue
+
+    def put(self, ac_ids, setpoint):
+        with self.condition:
+            for ac_id in ac_ids:
+                self.received += 1
+                if ac_id in self.pending:
+                    self.coalesced += 1
+                self.pending[ac_id] = setpoint
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while True:
+                    now = time.time()
+                    ready = [ ac_id for ac_id in self.pending if self.due.get(ac_id, 0.0) <= now ]
+                    if ready:
+                        break
+                    timeout = min( self.due[ac_id] for ac_id in self.pending ) - now if self.pending else None
+                    self.condition.wait(timeout)
+                setpoints = [ (ac_id, self.pending.pop(ac_id)) for ac_id in ready ]
+                for ac_id in ready:
+                    self.due[ac_id] = now + 1.0 / self.rate
+            if send_messages([ new_guidance_message(ac_id, *setpoint) for ac_id, setpoint in setpoints ]):
+                self.sent += len(setpoints)
+                continue
+            with self.condition:   # Retry at the next period unless a newer setpoint arrived meanwhile
+                for ac_id, setpoint in setpoints:
+                    self.pending.setdefault(ac_id, setpoint)
+                self.deferred += len(setpoints)
+
+    def start(self):
+        thread = threading.Thread(target=self.run, name="GuidanceStream")
+        thread.daemon = True
+        thread.start()
+
+    def to_dict(self):
+        return {'rate': self.rate, 'pending': len(self.pending), 'received': self.received, 'coalesced': self.coalesced,
+                'sent': self.sent, 'rejected': self.rejected, 'deferred': self.deferred}
+
+guidance_stream = GuidanceStream(guidance_rate)
+
+def parse_guidance_setpoint(line):
+    # Returns (ac_ids, (flags, x, y, z, yaw)) from a json setpoint line; raises ValueError.
+    # A setpoint without an ac_id applies to every client aircraft.
+    setpoint = json.loads(line)
+    if not isinstance(setpoint, dict):
+        raise ValueError("setpoint must be a json object")
+    if 'ac_id' in setpoint:
+        try:
+            ac_ids = [int(setpoint['ac_id'])]
+        except (TypeError, ValueError):
+            raise ValueError("invalid ac_id")
+        if ac_ids[0] not in aircrafts:
+            raise ValueError("unknown aircraft id %d" % ac_ids[0])
+    else:
+        ac_ids = list(aircraft_view.ids)
+    try:
+        values = [int(setpoint.get('flags', 0))]
+    except (TypeError, ValueError):
+        raise ValueError("invalid flags")
+    for name in ('x', 'y', 'z', 'yaw'):
+        try:
+            value = float(setpoint.get(name, 0.0))
+        except (TypeError, ValueError):
+            raise ValueError("invalid %s" % name)
+        if value != value or value in (float('inf'), float('-inf')):
+            raise ValueError("invalid %s" % name)
+        values.append(value)
+    return ac_ids, tuple(values)
+
+
+# --- Formation related state/methods
+
+formation_shapes = ('line', 'grid', 'circle', 'v')
+
+def formation_offsets(shape, count, spacing):
+    # Returns the (east, north) offsets in meters of count aircraft from the formation center, heading north:
+    # line abreast, square grid, circle with spacing between neighbours, or V with the leader at the center
+    i = numpy.arange(count, dtype=float)
+    if shape == 'line':
+        return (i - (count - 1) / 2.0) * spacing, numpy.zeros(count)
+    if shape == 'grid':
+        cols = int(numpy.ceil(numpy.sqrt(count)))
+        rows = int(numpy.ceil(count / float(cols)))
+        return (i % cols - (cols - 1) / 2.0) * spacing, ((rows - 1) / 2.0 - i // cols) * spacing
+    if shape == 'circle':
+        radius = spacing / (2.0 * numpy.sin(numpy.pi / count)) if count > 1 else 0.0
+        angle  = 2.0 * numpy.pi * i / count
+        return radius * numpy.sin(angle), radius * numpy.cos(angle)
+    rank = numpy.ceil(i / 2.0)                  # V: 0, 1, 1, 2, 2, ... behind the leader
+    side = numpy.where(i % 2 == 1, -1.0, 1.0)   # Odd positions on the left wing
+    return side * rank * spacing * numpy.sin(numpy.pi / 4), -rank * spacing * numpy.cos(numpy.pi / 4)
+
+def new_formation_messages(ac_ids, wp_id, shape, lat, lon, alt, spacing, heading):
+    # Move waypoint wp_id of every aircraft to its place in the formation, heading in degrees clockwise from north
+    east, north = formation_offsets(shape, len(ac_ids), spacing)
+    h = numpy.radians(heading)
+    east, north = east * numpy.cos(h) + north * numpy.sin(h), north * numpy.cos(h) - east * numpy.sin(h)
+    lats, lons = LocalFrame(lat, lon, alt).to_geodetic(east, north, numpy.zeros(len(ac_ids)))[:2]   # In the plane tangent at the center
+    return [ new_waypoint_message(ac_id, wp_id, float(lats[idx]), float(lons[idx]), alt) for idx, ac_id in enumerate(ac_ids) ]
+
+
+# --- Local coordinates related methods
+
+def get_local_frame(ac_id):
+    # Returns the local frame of the aircraft's flight plan; raises ValueError
+    if numpy is None:
+        raise ValueError("local coordinates require numpy")
+    if ac_id not in aircrafts:
+        raise ValueError("unknown aircraft id %d" % ac_id)
+    frame = aircrafts[ac_id].flightplan.frame
+    if frame is None:
+        raise ValueError("no lat0/lon0 in the flight plan of aircraft id %d" % ac_id)
+    return frame
+
+def new_local_points(pointlist):
+    # Validate a json list of {"ac_id", "wp_id", "east", "north", "up"} points; raises ValueError naming the
+    # offending point. A point without an ac_id applies to every client aircraft.
+    points = []
+    for idx, point in enumerate(pointlist):
+        if not isinstance(point, dict):
+            raise ValueError("point %d: must be a json object" % idx)
+        try:
+            ac_ids = [int(point['ac_id'])] if 'ac_id' in point else list(aircraft_view.ids)
+            wp_id  = int(point['wp_id'])
+            enu    = (float(point['east']), float(point['north']), float(point.get('up', 0.0)))
+        except KeyError as e:
+            raise ValueError("point %d: missing %s" % (idx, e))
+        except (TypeError, ValueError):
+            raise ValueError("point %d: invalid ac_id, wp_id, east, north or up" % idx)
+        for ac_id in ac_ids:
+            try:
+                get_local_frame(ac_id)
+            except ValueError as e:
+                raise ValueError("point %d: %s" % (idx, e))
+            points.append( (ac_id, wp_id) + enu )
+    return points
+
+def new_local_waypoint_messages(points):
+    # Convert the (ac_id, wp_id, east, north, up) points of each flight plan in one pass; messages keep the order
+    groups = {}
+    for idx, point in enumerate(points):
+        groups.setdefault(aircrafts[point[0]].flightplan.frame, []).append(idx)
+    msglist = [None] * len(points)
+    for frame, idxs in groups.items():
+        enu = numpy.array([ points[idx][2:] for idx in idxs ], dtype=float)
+        lats, lons, alts = frame.to_geodetic(enu[:, 0], enu[:, 1], enu[:, 2])
+        for pos, idx in enumerate(idxs):
+            msglist[idx] = new_waypoint_message(points[idx][0], points[idx][1], float(lats[pos]), float(lons[pos]), float(alts[pos]))
+    return msglist
+
+
+# --- Telemetry history related state/methods
+
+history_memory = 0   # Bytes allocated by all MessageHistory buffers
+
+class MessageHistory(object):
+    # Fixed size, array backed ring buffers of the numeric fields of one aircraft message
+    def __init__(self, depth, keys):
+        self.depth  = depth
+        self.keys   = keys
+        self.times  = array('d', [0.0]) * depth
+        self.values = dict( (key, array('d', [0.0]) * depth) for key in keys )
+        self.head    = 0     # Buffer index of the next sample
+        self.count   = 0     # Number of valid samples
+        self.version = 0     # Odd while the ivy thread appends a sample
+
+    def nbytes(self):
+        return self.times.itemsize * self.depth * (len(self.keys) + 1)
+
+    def append(self, timestamp, field_values):
+        self.version += 1
+        head = self.head
+        self.times[head] = timestamp
+        for key in self.keys:
+            try:
+                self.values[key][head] = float(field_values[key])
+            except (TypeError, ValueError):
+                self.values[key][head] = float('nan')   # Not a number in this message
+        self.head = (head + 1) % self.depth
+        if self.count < self.depth:
+            self.count += 1
+        self.version += 1
+
+    def query(self, key, since):
+        # Retry the copy if a sample was appended meanwhile, like Message.read()
+        while True:
+            version = self.version
+            if version % 2 == 0:
+                samples = self.query_samples(key, since)
+                if self.version == version:
+                    return samples
+            time.sleep(0)
+
+    def query_samples(self, key, since):
+        # Binary search the oldest-first logical index of the first sample newer than since,
+        # then copy only the samples from there on
+        depth  = self.depth
+        count  = self.count
+        start  = (self.head - count) % depth
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.times[(start + mid) % depth] <= since:
+                lo = mid + 1
+            else:
+                hi = mid
+        values = self.values[key]
+        return [ [self.times[(start + idx) % depth], values[(start + idx) % depth]] for idx in range(lo, count) ]
+
+def update_aircraft_history(aircraft, name, field_values, timestamp):
+    global history_memory
+    if name not in aircraft.history:
+        # Only fields that convert to a float are kept; no buffers are allocated past the memory cap
+        keys = []
+        for key, value in field_values.items():
+            try:
+                float(value)
+            except (TypeError, ValueError):
+                continue
+            keys.append(key)
+        history = MessageHistory(history_depth, keys) if history_depth > 0 and keys else None
+        if history is not None and history_memory + history.nbytes() > history_cap*1024*1024:
+            if verbose:
+                print("History memory cap reached, no history for %s of aircraft %d" % (name, aircraft.ac_id))
+            history = None
+        if history is not None:
+            history_memory += history.nbytes()
+        histories = dict(aircraft.history)   # Copy-on-write, like the message records; only the ivy thread adds
+        histories[name] = history
+        aircraft.history = histories
+    history = aircraft.history[name]
+    if history is not None:
+        history.append(timestamp, field_values)
+
+
+# --- Telemetry condition waiter related state/methods
+
+telemetry_ops = { '==': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge }
+
+telemetry_waiters     = {}                 # (ac_id, message name) -> list of waiters, checked by the ivy callback
+telemetry_waiter_lock = threading.Lock()
+
+class TelemetryWaiter(object):
+    # Calls callback(waiter) once, the first time msg_name.msg_key of aircraft ac_id satisfies the condition
+    def __init__(self, ac_id, msg_name, msg_key, op, value, callback):
+        self.ac_id    = ac_id
+        self.msg_name = msg_name
+        self.msg_key  = msg_key
+        self.op       = op
+        self.value    = value
+        self.callback = callback
+
+    def test(self, field_values):
+        if self.msg_key not in field_values:
+            return False
+        return compare_telemetry_value(field_values[self.msg_key], self.op, self.value)
+
+def compare_telemetry_value(actual, op, expected):
+    # Numeric comparison if both sides are numbers, string comparison otherwise
+    try:
+        return telemetry_ops[op](float(actual), float(expected))
+    except (TypeError, ValueError):
+        return telemetry_ops[op](str(actual), str(expected))
+
+def add_telemetry_waiter(waiter, check_now=True):
+    with telemetry_waiter_lock:
+        telemetry_waiters.setdefault((waiter.ac_id, waiter.msg_name), []).append(waiter)
+    # Bind the message if it is not bound yet; the binding is not narrowed when waiters are removed, which happens
+    # on the ivy thread, but at the next update
+    if not ivy_subscription.bound(waiter.msg_name):
+        ivy_subscription.update()
+    # The condition may already hold
+    if check_now and waiter.ac_id in aircrafts:
+        message = aircrafts[waiter.ac_id].messages.get(waiter.msg_name)
+        if message is not None:
+            check_telemetry_waiters(waiter.ac_id, waiter.msg_name, message.field_values)
+
+def remove_telemetry_waiter(waiter):
+    # Returns True if the waiter was still registered(i.e. it has not been triggered)
+    with telemetry_waiter_lock:
+        waiters = telemetry_waiters.get((waiter.ac_id, waiter.msg_name), [])
+        if waiter not in waiters:
+            return False
+        waiters.remove(waiter)
+        if not waiters:
+            del telemetry_waiters[(waiter.ac_id, waiter.msg_name)]
+        return True
+
+def check_telemetry_waiters(ac_id, msg_name, field_values):
+    for waiter in list(telemetry_waiters.get((ac_id, msg_name), [])):
+        if waiter.test(field_values) and remove_telemetry_waiter(waiter):
+            waiter.callback(waiter)
+
+
+# --- Mission sequencer related state/methods
+
+missions        = {}        # mission id -> Mission
+mission_counter = count(1)
+
+class Mission(object):
+    # Runs a list of steps on its own thread. Step formats:
+    #   {"send":  [<batch command>, ...]}                                   send the commands in one burst
+    #   {"sleep": <seconds>}                                                wait a fixed time
+    #   {"wait":  {"ac_id": <id>, "msg_name": <name>, "msg_key": <key>,     wait for a telemetry condition; without
+    #              "op": "==", "value": <value>}, "timeout": <seconds>}     an ac_id it must hold for all client aircraft
+    def __init__(self, mission_id, steps):
+        self.mission_id = mission_id
+        self.steps      = steps
+        self.state      = 'running'      # running, done, aborted, timeout, send failed
+        self.step       = 0
+        self.started    = time.time()
+        self.finished   = None
+        self.wake       = threading.Event()
+        self.aborted    = False
+
+    def run(self):
+        for self.step, step in enumerate(self.steps):
+            if self.aborted:
+                break
+            if 'send' in step:
+                if not send_messages(step['send'], True, lambda: self.aborted):
+                    if not self.aborted:
+                        self.state = 'send failed'
+                    break
+            elif 'sleep' in step:
+                self.wake.clear()
+                if not self.aborted:
+                    self.wake.wait(step['sleep'])
+            elif not self.wait(step):
+                self.state = 'timeout'
+                break
+        if self.state == 'running':
+            self.state = 'aborted' if self.aborted else 'done'
+        self.finished = time.time()
+
+    def wait(self, step):
+        self.wake.clear()
+        pending = set(step['ac_ids'])
+        def satisfied(waiter):
+            pending.discard(waiter.ac_id)
+            if not pending:
+                self.wake.set()
+        cond    = step['wait']
+        waiters = [ TelemetryWaiter(ac_id, cond['msg_name'], cond['msg_key'], cond['op'], cond['value'], satisfied) for ac_id in step['ac_ids'] ]
+        for waiter in waiters:
+            add_telemetry_waiter(waiter)
+        if pending and not self.aborted:
+            self.wake.wait(step['timeout'])
+        for waiter in waiters:
+            remove_telemetry_waiter(waiter)
+        return not pending or self.aborted
+
+    def abort(self):
+        self.aborted = True
+        self.wake.set()
+
+    def start(self):
+        thread = threading.Thread(target=self.run, name="Mission-%d" % self.mission_id)
+        thread.daemon = True
+        thread.start()
+
+    def to_dict(self):
+        elapsed = (self.finished or time.time()) - self.started
+        return {'id': self.mission_id, 'state': self.state, 'step': self.step, 'steps': len(self.steps), 'elapsed': round(elapsed, 3)}
+
+def mission_seconds(value):
+    # Returns value as a finite, non negative number of seconds; raises TypeError or ValueError
+    seconds = float(value)
+    if not 0.0 <= seconds < float('inf'):   # Also false for NaN
+        raise ValueError("invalid seconds")
+    return seconds
+
+def new_mission_steps(steplist):
+    # Validate the steps and build their messages up front; raises ValueError naming the offending step
+    steps = []
+    for idx, step in enumerate(steplist):
+        if not isinstance(step, dict):
+            raise ValueError("step %d: expected an object" % idx)
+        if 'send' in step:
+            if not isinstance(step['send'], list):
+                raise ValueError("step %d: send must be a list of commands" % idx)
+            try:
+                steps.append({'send': new_batch_messages(step['send'])})
+            except ValueError as e:
+                raise ValueError("step %d: %s" % (idx, e))
+            if len(steps[-1]['send']) > send_queue.size:
+                raise ValueError("step %d: %d messages do not fit in the send queue(%d)" % (idx, len(steps[-1]['send']), send_queue.size))
+        elif 'sleep' in step:
+            try:
+                steps.append({'sleep': mission_seconds(step['sleep'])})
+            except (TypeError, ValueError):
+                raise ValueError("step %d: invalid sleep" % idx)
+        elif 'wait' in step:
+            cond = step['wait']
+            if not isinstance(cond, dict) or 'msg_name' not in cond or 'msg_key' not in cond or 'value' not in cond:
+                raise ValueError("step %d: wait needs msg_name, msg_key and value" % idx)
+            if cond.setdefault('op', '==') not in telemetry_ops:
+                raise ValueError("step %d: unknown op %s" % (idx, cond['op']))
+            try:
+                ac_ids = [ int(cond['ac_id']) ] if 'ac_id' in cond else list(aircraft_view.ids)
+                timeout = mission_seconds(step.get('timeout', 60.0))
+            except (TypeError, ValueError):
+                raise ValueError("step %d: invalid ac_id or timeout" % idx)
+            if 'ac_id' in cond and ac_ids[0] not in aircrafts:
+                raise ValueError("step %d: unknown aircraft id %d" % (idx, ac_ids[0]))
+            steps.append({'wait': cond, 'ac_ids': ac_ids, 'timeout': timeout})
+        else:
+            raise ValueError("step %d: expected send, sleep or wait" % idx)
+    return steps
+
+
+# --- Command latency tracing related state/methods
+
+command_timeout = 10.0   # Seconds without confirming telemetry before a command counts as unacknowledged
+latency_buckets = [0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0]   # Upper bounds of the histogram buckets, seconds
+
+class LatencyStats(object):
+    # Command to telemetry latency of one command type of one aircraft
+    def __init__(self):
+        self.sent       = 0
+        self.acked      = 0
+        self.unacked    = 0
+        self.superseded = 0      # Replaced by a newer command of the same type before being confirmed
+        self.total      = 0.0
+        self.max        = 0.0
+        self.histogram  = [0] * (len(latency_buckets) + 1)
+
+    def add(self, latency):
+        self.acked += 1
+        self.total += latency
+        self.max    = max(self.max, latency)
+        self.histogram[bisect.bisect_left(latency_buckets, latency)] += 1
+
+    def to_dict(self):
+        return {'sent': self.sent, 'acked': self.acked, 'unacked': self.unacked, 'superseded': self.superseded,
+                'mean_ms': round(self.total / self.acked * 1000.0, 1) if self.acked else None,
+                'max_ms': round(self.max * 1000.0, 1),
+                'histogram': [ [ int(bound * 1000) if bound is not None else None, count ]
+                               for bound, count in zip(latency_buckets + [None], self.histogram) ]}
+
+class CommandTrace(object):
+    __slots__ = ('ac_id', 'command', 'target', 'sent', 'waiter')
+
+    def __init__(self, ac_id, command, target, sent):
+        self.ac_id   = ac_id
+        self.command = command
+        self.target  = target
+        self.sent    = sent
+        self.waiter  = None
+
+    def to_dict(self, now):
+        return {'ac_id': self.ac_id, 'command': self.command, 'target': self.target, 'sent': self.sent,
+                'age': round(now - self.sent, 3)}
+
+class CommandTracer(object):
+    # Matches each command sent on the ivy bus with the telemetry confirming it, through a telemetry waiter that
+    # only looks at messages received after the send:
+    #   JUMP_TO_BLOCK       ROTORCRAFT_NAV_STATUS.cur_block == block_id
+    #   DL_SETTING(auto2)   ROTORCRAFT_STATUS.ap_mode       == value
+    #   MOVE_WAYPOINT       WP_MOVED.wp_id                  == wp_id
+    messages = ('ROTORCRAFT_NAV_STATUS', 'ROTORCRAFT_STATUS', 'WP_MOVED')
+
+    def __init__(self, timeout):
+        self.timeout        = timeout
+        self.lock           = threading.Lock()
+        self.pending        = {}    # (ac_id, command, wp_id or None) -> CommandTrace waiting for telemetry
+        self.stats          = {}    # ac_id -> command -> LatencyStats
+        self.unacknowledged = deque(maxlen=100)   # Latest commands never confirmed, as dicts
+
+    def confirmation(self, msg):
+        # Returns the (msg_name, msg_key, value) confirming a command, or None if the command is not traced
+        if msg.name == 'JUMP_TO_BLOCK':
+            return ('ROTORCRAFT_NAV_STATUS', 'cur_block', msg['block_id'])
+        if msg.name == 'MOVE_WAYPOINT':
+            return ('WP_MOVED', 'wp_id', msg['wp_id'])
+        if msg.name == 'DL_SETTING' and msg['index'] == get_auto2_index(msg['ac_id']):
+            return ('ROTORCRAFT_STATUS', 'ap_mode', msg['value'])
+        return None
+
+    def get_stats(self, ac_id, command):
+        return self.stats.setdefault(ac_id, {}).setdefault(command, LatencyStats())
+
+    def sent(self, msg, now):
+        # Called by the send queue worker after the message was sent
+        confirmation = self.confirmation(msg)
+        if confirmation is None:
+            return
+        ac_id = msg['ac_id']
+        key   = (ac_id, msg.name, msg['wp_id'] if msg.name == 'MOVE_WAYPOINT' else None)
+        trace = CommandTrace(ac_id, msg.name, confirmation[2], now)
+        trace.waiter = TelemetryWaiter(ac_id, confirmation[0], confirmation[1], '==', confirmation[2],
+                                       lambda waiter: self.acknowledged(key, trace))
+        with self.lock:
+            previous = self.pending.get(key)
+            self.pending[key] = trace
+            stats = self.get_stats(ac_id, msg.name)
+            stats.sent += 1
+            if previous is not None:
+                stats.superseded += 1
+        if previous is not None:
+            remove_telemetry_waiter(previous.waiter)
+        add_telemetry_waiter(trace.waiter, check_now=False)
+        self.expire(now)
+
+    def acknowledged(self, key, trace):
+        # Called by the ivy callback with the confirming telemetry
+        latency = time.time() - trace.sent
+        with self.lock:
+            if self.pending.get(key) is not trace:
+                return   # Superseded or expired meanwhile
+            del self.pending[key]
+            self.get_stats(trace.ac_id, trace.command).add(latency)
+
+    def expire(self, now):
+        with self.lock:
+            expired = [ key for key, trace in self.pending.items() if now - trace.sent > self.timeout ]
+            traces  = [ self.pending.pop(key) for key in expired ]
+            for trace in traces:
+                self.get_stats(trace.ac_id, trace.command).unacked += 1
+                self.unacknowledged.append(trace.to_dict(now))
+        for trace in traces:
+            remove_telemetry_waiter(trace.waiter)
+
+    def to_dict(self, ac_id=None):
+        now = time.time()
+        self.expire(now)
+        with self.lock:
+            stats   = dict( (acid, dict( (command, command_stats.to_dict()) for command, command_stats in commands.items() ))
+                            for acid, commands in self.stats.items() if ac_id is None or acid == ac_id )
+            pending = [ trace.to_dict(now) for trace in self.pending.values() if ac_id is None or trace.ac_id == ac_id ]
+            unacked = [ trace for trace in self.unacknowledged if ac_id is None or trace['ac_id'] == ac_id ]
+        return {'timeout': self.timeout, 'aircraft': stats, 'pending': sorted(pending, key=lambda trace: trace['sent']),
+                'unacknowledged': unacked}
+
+command_tracer = CommandTracer(command_timeout)
+
+
+# --- Telemetry rule related state/methods
+
+telemetry_rules = []   # Compiled rules of the client configuration
+rule_index      = {}   # msg_name -> {msg_key: [rules]}, rebound when the client configuration is loaded
+
+class TelemetryRule(object):
+    # Compiled <rule> of the client configuration, e.g.
+    #   <rule name="LOW_VOLT" msg_name="ROTORCRAFT_STATUS" msg_key="vsupply" op="<" value="10.5" hold="3.0"
+    #         action="flightblock" target="land" />
+    # The action is sent once to an aircraft after the condition held for hold seconds, and again only after the
+    # condition was false. Actions: flightblock(target: block name or id), setmode(target: auto2 value) and
+    # guidance(target: flags/x/y/z/yaw). Without an ac_id attribute the rule applies to every aircraft.
+    def __init__(self, attrs):
+        self.attrs    = dict(attrs)   # Kept for the startup snapshot
+        self.msg_name = attrs.get('msg_name')
+        self.msg_key  = attrs.get('msg_key')
+        self.name     = attrs.get('name') or '%s.%s' % (self.msg_name, self.msg_key)
+        self.op       = attrs.get('op', '==')
+        self.action   = attrs.get('action')
+        self.target   = attrs.get('target', '')
+        if not self.msg_name or not self.msg_key or 'value' not in attrs:
+            raise ValueError("rule %s: needs msg_name, msg_key and value" % self.name)
+        if self.op not in telemetry_ops:
+            raise ValueError("rule %s: unknown op %s" % (self.name, self.op))
+        self.compare = telemetry_ops[self.op]
+        try:
+            self.value = float(attrs['value'])   # Compared as numbers, or as strings if not a number
+        except ValueError:
+            self.value = attrs['value']
+        try:
+            self.hold  = float(attrs.get('hold', 0.0))
+            self.ac_id = int(attrs['ac_id']) if attrs.get('ac_id') else None
+        except ValueError:
+            raise ValueError("rule %s: invalid hold or ac_id" % self.name)
+        if self.action == 'flightblock':
+            self.command = {'msg': 'JUMP_TO_BLOCK'}
+        elif self.action == 'setmode':
+            self.command = {'msg': 'DL_SETTING', 'value': self.target}
+        elif self.action == 'guidance':
+            fields = self.target.split('/')
+            if len(fields) != 5:
+                raise ValueError("rule %s: guidance target must be flags/x/y/z/yaw" % self.name)
+            self.command = dict(zip(['flags', 'x', 'y', 'z', 'yaw'], fields), msg='GUIDED_SETPOINT_NED')
+        else:
+            raise ValueError("rule %s: unknown action %s, expected flightblock, setmode or guidance" % (self.name, self.action))
+        self.lock  = threading.Lock()   # Guards the state below, changed by the ivy thread and read by the routes
+        self.since = {}      # ac_id -> time the condition became true
+        self.fired = set()   # ac_ids the action was sent to since the condition became true
+        self.count = 0       # Number of actions sent
+        self.last  = None    # Time of the latest action
+
+    def test(self, value):
+        if isinstance(self.value, float):
+            try:
+                return self.compare(float(value), self.value)
+            except (TypeError, ValueError):
+                pass
+        return self.compare(str(value), str(self.value))
+
+    def check(self, ac_id, value, now):
+        # Returns True when the action is due for the aircraft
+        if self.ac_id is not None and ac_id != self.ac_id:
+            return False
+        holds = self.test(value)
+        with self.lock:
+            if not holds:
+                self.since.pop(ac_id, None)
+                self.fired.discard(ac_id)
+                return False
+            since = self.since.setdefault(ac_id, now)
+            return ac_id not in self.fired and now - since >= self.hold
+
+    def fire(self, ac_id, now=None):
+        # Record the action as sent at now, or as failed(now None); either way it is not sent again while the
+        # condition holds
+        with self.lock:
+            self.fired.add(ac_id)
+            if now is not None:
+                self.count += 1
+                self.last   = now
+
+    def fired_ids(self):
+        with self.lock:
+            return sorted(self.fired)
+
+    def new_messages(self, ac_id):
+        # Build the action through the batch command validation; raises ValueError
+        command = dict(self.command, ac_id=ac_id)
+        if self.action == 'flightblock':
+            fb_id = aircrafts[ac_id].flightplan.flightblock_index.get(self.target)
+            command['block_id'] = fb_id if fb_id is not None else self.target
+        return new_batch_messages([command])
+
+    def to_dict(self):
+        now = time.time()
+        with self.lock:
+            holding = dict( (ac_id, round(now - since, 3)) for ac_id, since in self.since.items() )
+            fired, count, last = sorted(self.fired), self.count, self.last
+        return {'name': self.name, 'msg_name': self.msg_name, 'msg_key': self.msg_key, 'op': self.op,
+                'value': self.value, 'hold': self.hold, 'ac_id': self.ac_id, 'action': self.action, 'target': self.target,
+                'holding': holding, 'fired': fired, 'count': count, 'last': last}
+
+def new_rule_index(rules):
+    index = {}
+    for rule in rules:
+        index.setdefault(rule.msg_name, {}).setdefault(rule.msg_key, []).append(rule)
+    return index
+
+def warm_rule_settings(rules):
+    # Read the auto2 setting index of the aircraft a setmode rule applies to, so the ivy thread finds it in the
+    # settings cache instead of parsing settings.xml
+    for rule in rules:
+        if rule.action == 'setmode':
+            for ac_id in ([rule.ac_id] if rule.ac_id is not None else list(aircrafts)):
+                if ac_id in aircrafts:
+                    get_auto2_index(ac_id)
+
+def post_fired_rules():
+    # Publish the [rule name, ac_id] pairs whose action was sent and whose condition still holds
+    status_stream.post('rules', [ [fired_rule.name, fired_id] for fired_rule in telemetry_rules for fired_id in fired_rule.fired_ids() ])
+
+def check_telemetry_rules(keys, ac_id, field_values, now):
+    # Called by the ivy callback with the rules of the received message, by message key
+    for key, rules in keys.items():
+        if key not in field_values:
+            continue
+        value = field_values[key]
+        for rule in rules:
+            fired = ac_id in rule.fired
+            if not rule.check(ac_id, value, now):
+                if fired and ac_id not in rule.fired:
+                    post_fired_rules()
+                continue
+            try:
+                msglist = rule.new_messages(ac_id)
+            except ValueError as e:
+                rule.fire(ac_id)        # Do not retry on every message
+                print("Rule %s not applied to aircraft %d: %s" % (rule.name, ac_id, e))
+                continue
+            if send_messages(msglist):  # Retried with the next message if the send queue is full
+                rule.fire(ac_id, now)
+                print("Rule %s triggered: ac_id=%d, %s=%s" % (rule.name, ac_id, key, value))
+                post_fired_rules()
+
+
+# --- Status stream(server push) related state/methods
+
+class StatusStream(object):
+    # Coalesces changed status cells from the ivy callback and publishes them as one frame per tick
+    def __init__(self, tick):
+        self.tick      = tick
+        self.condition = threading.Condition()
+        self.values    = {}      # (ac_id, column) -> latest value
+        self.pending   = {}      # (ac_id, column) -> value changed since the last frame
+        self.messages  = {}      # (ac_id, column) -> Message record, used to detect stale cells
+        self.stale     = {}      # (ac_id, column) -> stale flag sent in the latest frame
+        self.posted    = {}      # name -> latest value posted by a server side monitor
+        self.pending_posts = {}  # name -> value posted since the last frame
+        self.seq       = 0       # Sequence number of the latest frame
+        self.reset_seq = 0       # Sequence number of the latest reset frame
+        self.frame     = None    # Latest frame, formatted as a server-sent event
+
+    def update(self, ac_id, columns, message):
+        field_values = message.field_values
+        with self.condition:
+            for col, key in columns:
+                value = str(field_values.get(key, ''))
+                cell  = (ac_id, col)
+                self.messages[cell] = message
+                if self.values.get(cell) != value:
+                    self.values[cell]  = value
+                    self.pending[cell] = value
+
+    def post(self, name, value):
+        # Publish a json value under name in the next frame(and in the first frame of later subscribers)
+        with self.condition:
+            self.posted[name]        = value
+            self.pending_posts[name] = value
+
+    def format_frame(self, cells, stale, posts, reset=False):
+        celllist  = [ [ac_id, col, value] for (ac_id, col), value in cells.items() ]
+        stalelist = [ [ac_id, col, flag] for (ac_id, col), flag in stale.items() ]
+        frame = dict(posts)
+        frame.update({'seq': self.seq, 'cells': celllist, 'stale': stalelist})
+        if reset:
+            frame['reset'] = True   # The status columns changed, the subscriber's columns are out of date
+        return 'data: %s\n\n' % json.dumps(frame)
+
+    def publish(self):
+        now = time.time()
+        with self.condition:
+            stale = {}
+            for cell, message in self.messages.items():
+                flag = message.is_stale(now)
+                if self.stale.get(cell) != flag:
+                    self.stale[cell] = flag
+                    stale[cell]      = flag
+            if self.pending or stale or self.pending_posts:
+                self.seq    += 1
+                self.frame   = self.format_frame(self.pending, stale, self.pending_posts)
+                self.pending = {}
+                self.pending_posts = {}
+                self.condition.notify_all()
+
+    def reset(self, aircrafts, msg_index):
+        # The status columns changed(configuration reload): rebuild every cell from the current message records
+        # with the new columns, so no cell of an old column is left behind, and send them as a full reset frame
+        now = time.time()
+        with self.condition:
+            self.values   = {}
+            self.pending  = {}
+            self.messages = {}
+            self.stale    = {}
+            for ac_id in aircrafts:
+                messages = aircrafts[ac_id].messages
+                for name, columns in msg_index.items():
+                    message = messages.get(name)
+                    if message is None:
+                        continue
+                    field_values = message.field_values
+                    for col, key in columns:
+                        cell = (ac_id, col)
+                        self.values[cell]   = str(field_values.get(key, ''))
+                        self.messages[cell] = message
+                        self.stale[cell]    = message.is_stale(now)
+            self.seq      += 1
+            self.reset_seq = self.seq
+            self.frame     = self.format_frame(self.values, self.stale, self.posted, True)
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            time.sleep(self.tick)
+            self.publish()
+
+    def start(self):
+        thread = threading.Thread(target=self.run, name="StatusStream")
+        thread.daemon = True
+        thread.start()
+
+    def frames(self):
+        # Start each subscriber with a full frame, then send deltas; resend a full frame if one was missed
+        with self.condition:
+            seq   = self.seq
+            frame = self.format_frame(self.values, self.stale, self.posted)
+        yield frame
+        while True:
+            with self.condition:
+                if self.seq == seq:
+                    self.condition.wait(15.0)
+                if self.seq == seq:
+                    frame = ': keepalive\n\n'
+                elif self.seq == seq + 1:
+                    frame = self.frame
+                else:
+                    frame = self.format_frame(self.values, self.stale, self.posted, seq < self.reset_seq)
+                seq = self.seq
+            yield frame
+
+status_stream = StatusStream(stream_tick)
+
+
+# --- Separation monitor related state/methods
+
+separation_minimum = 5.0   # Default minimum separation in meters, 0 disables the monitor
+separation_timeout = 5.0   # Seconds without a position before an aircraft is dropped from the monitor
+
+class SeparationMonitor(object):
+    # Keeps the latest GPS_INT position(ECEF, meters) of every aircraft in a hash grid of cells as large as the
+    # minimum separation, so only aircraft in neighbouring cells can be too close. The ivy callback only records
+    # positions; a worker thread moves the aircraft that reported since the last pass in the grid and checks them
+    # against their neighbours. Violations and closest approaches are published on the status stream. Aircraft
+    # that stop reporting are dropped after timeout seconds, and their violations end.
+    neighbours = [ (dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1) ]
+
+    def __init__(self, minimum, interval, timeout):
+        self.minimum    = minimum
+        self.interval   = interval
+        self.timeout    = timeout
+        self.lock       = threading.Lock()
+        self.reported   = {}         # ac_id -> (position, time) received since the last pass
+        self.positions  = {}         # ac_id -> (x, y, z)
+        self.times      = {}         # ac_id -> time of the latest position
+        self.cells      = {}         # ac_id -> grid cell
+        self.grid       = {}         # grid cell -> set of ac_ids
+        self.violations = {}         # (ac_id, ac_id) -> [distance, closest distance, since]
+        self.partners   = {}         # ac_id -> set of ac_ids it is too close to
+        self.events     = deque(maxlen=100)   # Ended violations: [ac_id, ac_id, closest distance, since, until]
+        self.checks     = 0          # Pairs checked in the latest pass
+        self.running    = False
+
+    def update(self, ac_id, field_values, now):
+        # Called by the ivy callback on GPS_INT, positions without a 3D fix are ignored
+        try:
+            if int(field_values.get('fix', 3)) < 3:
+                return
+            position = (float(field_values['ecef_x']) / 100.0, float(field_values['ecef_y']) / 100.0,
+                        float(field_values['ecef_z']) / 100.0)
+        except (KeyError, TypeError, ValueError):
+            return
+        with self.lock:
+            self.reported[ac_id] = (position, now)
+
+    def cell(self, position):
+        return (int(position[0] // self.minimum), int(position[1] // self.minimum), int(position[2] // self.minimum))
+
+    def leave_cell(self, ac_id):
+        cell = self.cells.pop(ac_id)
+        self.grid[cell].discard(ac_id)
+        if not self.grid[cell]:
+            del self.grid[cell]
+
+    def end_violation(self, ac_id, other, now):
+        pair = (min(ac_id, other), max(ac_id, other))
+        distance, closest, since = self.violations.pop(pair)
+        self.partners[ac_id].discard(other)
+        self.partners[other].discard(ac_id)
+        self.events.append( [pair[0], pair[1], round(closest, 2), since, now] )
+
+    def expire(self, now):
+        # Drop the aircraft without a position for timeout seconds; returns True if a violation ended
+        ended   = False
+        expired = [ other for other, seen in self.times.items() if now - seen > self.timeout ]
+        for ac_id in expired:
+            for other in list(self.partners.get(ac_id, ())):
+                self.end_violation(ac_id, other, now)
+                ended = True
+            self.leave_cell(ac_id)
+            self.partners.pop(ac_id, None)
+            del self.positions[ac_id]
+            del self.times[ac_id]
+        return ended
+
+    def check(self):
+        # Returns True if the violations changed
+        with self.lock:
+            reported, self.reported = self.reported, {}
+        now     = time.time()
+        changed = self.expire(now)
+        for ac_id, (position, seen) in reported.items():
+            cell = self.cell(position)
+            if self.cells.get(ac_id) != cell:
+                if ac_id in self.cells:
+                    self.leave_cell(ac_id)
+                self.grid.setdefault(cell, set()).add(ac_id)
+                self.cells[ac_id] = cell
+            self.positions[ac_id] = position
+            self.times[ac_id]     = seen
+        checks  = 0
+        for ac_id in reported:
+            (x, y, z), (cx, cy, cz) = self.positions[ac_id], self.cells[ac_id]
+            close = set()
+            for dx, dy, dz in self.neighbours:
+                for other in self.grid.get((cx+dx, cy+dy, cz+dz), ()):
+                    if other == ac_id:
+                        continue
+                    checks += 1
+                    ox, oy, oz = self.positions[other]
+                    distance = sqrt((x-ox)**2 + (y-oy)**2 + (z-oz)**2)
+                    if distance < self.minimum:
+                        close.add(other)
+                        pair = (min(ac_id, other), max(ac_id, other))
+                        violation = self.violations.get(pair)
+                        if violation is None:
+                            self.violations[pair] = [distance, distance, now]
+                            self.partners.setdefault(ac_id, set()).add(other)
+                            self.partners.setdefault(other, set()).add(ac_id)
+                        else:
+                            violation[0] = distance
+                            violation[1] = min(violation[1], distance)
+                        changed = True
+            for other in self.partners.get(ac_id, set()) - close:
+                self.end_violation(ac_id, other, now)
+                changed = True
+        self.checks = checks
+        return changed
+
+    def violation_list(self):
+        return [ [pair[0], pair[1], round(violation[0], 2), round(violation[1], 2)]
+                 for pair, violation in sorted(self.violations.items()) ]
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                if self.check():
+                    status_stream.post('separation', self.violation_list())
+            except Exception as e:
+                print("Separation check failed: %s" % e)
+
+    def start(self):
+        self.running = True
+        thread = threading.Thread(target=self.run, name="SeparationMonitor")
+        thread.daemon = True
+        thread.start()
+
+    def to_dict(self):
+        now = time.time()
+        return {'minimum': self.minimum, 'aircraft': len(self.positions), 'checks': self.checks,
+                'violations': [ {'ac_ids': [pair[0], pair[1]], 'distance': round(violation[0], 2),
+                                 'closest': round(violation[1], 2), 'duration': round(now - violation[2], 3)}
+                                for pair, violation in sorted(self.violations.items()) ],
+                'events': [ {'ac_ids': [event[0], event[1]], 'closest': event[2], 'since': event[3], 'until': event[4]}
+                            for event in self.events ]}
+
+separation_monitor = SeparationMonitor(separation_minimum, 0.2, separation_timeout)
+
+
+# --- Rendered client view cache related state/methods
+
+rendered_view_cap = 64   # Upper bound on cached pages, view_mode/button_size/cols come from the request
+
+class RenderedView(object):
+    __slots__ = ('depends', 'body', 'etag')
+
+    def __init__(self, depends, body):
+        self.depends = depends   # The client views and layout the page was rendered from
+        self.body    = body
+        self.etag    = hashlib.sha1(body.encode('utf-8')).hexdigest()
+
+rendered_views = {}   # (template, view_mode, button_size, cols) -> RenderedView
+
+def render_client_view(template, rows, cols, **params):
+    # The client views and the layout are immutable and rebound on change, so a cached page is
+    # current as long as it was rendered from the very same objects; nothing else has to be invalidated
+    depends = (rows, cols, layout.get(0))
+    key     = (template, params['p_view_mode'], params['p_button_size'], params.get('p_layout_cols'))
+    rendered = rendered_views.get(key)
+    if rendered is None or rendered.depends != depends:
+        rendered = RenderedView(depends, render_template(template, p_host=server_host, p_port=server_port,
+                                                         p_rows=rows, p_row_count=len(rows), p_cols=cols, **params))
+        if len(rendered_views) >= rendered_view_cap:
+            rendered_views.clear()
+        rendered_views[key] = rendered
+    response = Response(rendered.body)
+    response.set_etag(rendered.etag)
+    response.cache_control.no_cache = True   # Let the browser keep the page but revalidate it on each load
+    return response.make_conditional(request)
+
+
+
+# --- JSON API(precomputed documents) related state/methods
+
+class JsonDocument(object):
+    __slots__ = ('depends', 'body', 'gzip_body', 'etag')
+
+    def __init__(self, depends, body):
+        self.depends   = depends   # The objects the document was serialized from
+        self.body      = body
+        compressor     = zlib.compressobj(9, zlib.DEFLATED, 31)   # wbits 31 gives a gzip container
+        self.gzip_body = compressor.compress(body) + compressor.flush()
+        self.etag      = hashlib.sha1(body).hexdigest()
+
+api_documents = {}   # document key -> JsonDocument
+
+def get_api_document(key, depends, build):
+    # Same scheme as the rendered views: state is rebound on change, so a document is rebuilt only
+    # the first time it is asked for after the objects it was built from were replaced
+    document = api_documents.get(key)
+    if document is None or document.depends != depends:
+        document = JsonDocument(depends, build().encode('utf-8'))
+        api_documents[key] = document
+    return document
+
+def api_response(document):
+    if 'gzip' in request.accept_encodings:
+        response = Response(document.gzip_body, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(document.etag + '-gz')
+    else:
+        response = Response(document.body, mimetype='application/json')
+        response.set_etag(document.etag)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def aircraft_summary(aircraft):
+    return { 'id': aircraft.ac_id, 'name': aircraft.name, 'color': aircraft.color }
+
+def api_aircraft_list_document():
+    acs = aircrafts
+    return get_api_document('aircraft', (acs,), lambda: json.dumps([ aircraft_summary(acs[ac_id]) for ac_id in sorted(acs) ]))
+
+def api_aircraft_document(aircraft):
+    def build():
+        summary = aircraft_summary(aircraft)
+        summary['waypoints']    = [ { 'id': wp_id, 'name': wp.wp_name, 'x': wp.wp_x, 'y': wp.wp_y }
+                                    for wp_id, wp in sorted(aircraft.waypoints.items()) ]
+        summary['flightblocks'] = [ { 'id': fb_id, 'name': fb.fb_name } for fb_id, fb in sorted(aircraft.flightblocks.items()) ]
+        return json.dumps(summary)
+    return get_api_document(('aircraft', aircraft.ac_id), (aircraft, aircraft.color, aircraft.flightplan), build)
+
+def api_client_document():
+    views = (('aircraft', aircraft_view), ('flightblock', flightblock_view), ('guided', guided_view),
+             ('waypoint', waypoint_view), ('status', status_view))
+    current = layout.get(0)
+    def build():
+        # The views carry their own serialized json, only the layout is serialized here
+        parts = [ '"%s": %s' % (name, view.json) for name, view in views ]
+        if current is not None:
+            parts.append('"layout": %s' % json.dumps({ 'name': current.name, 'rows': current.rows, 'cols': current.cols }))
+        return '{%s}' % ', '.join(parts)
+    return get_api_document('client', tuple(view for name, view in views) + (current,), build)
+
+def warm_api_documents():
+    api_aircraft_list_document()
+    for ac_id in aircrafts:
+        api_aircraft_document(aircrafts[ac_id])
+    api_client_document()
 
-st_color_list              = []   # Used by status view color cycler
-st_label_list              = []   # Used by status view label cycler
-st_icon_list               = []   # Used by status view icon cycler
-st_tooltip_list            = []   # Used by status view tooltip cycler
 
 
 # --- Helper methods ---
@@ -261,57 +1753,57 @@ def print_ivy_trace(msg):
 from lxml import etree  as ET    
 PPRZ_SRC_CONF = os.path.join(PPRZ_SRC, "conf")
 
-def view_attributelist_helper(view, view_color_list, view_label_list, view_icon_list, view_tooltip_list):
-    color = view.get('color')
-    if color:  # Add it to the flight block color list, TODO: possibly add color attribute to flightblock object
-        view_color_list.append(color)
-    else:
-        view_color_list.append('white') # if the color list is empty set the default to white
-    label = view.get('label')
-    if label:
-        view_label_list.append(label)
-    else:
-        view_label_list.append('')            
-    icon = view.get('icon')
-    if icon:
-        view_icon_list.append(icon)
-    else:
-        view_icon_list.append('')
-    tooltip = view.get('tooltip')
-    if tooltip:
-        view_tooltip_list.append(tooltip)
-    else:
-        view_tooltip_list.append('')
+def new_view_item(view, item_id, name, msg_name=None, msg_key=None):
+    # Missing or empty attributes default to a white button without label, icon, or tooltip
+    return ViewItem(item_id, name, view.get('color') or 'white', view.get('label') or '', view.get('icon') or '',
+                    view.get('tooltip') or '', msg_name, msg_key)
 
 def static_init_client_configuration_data(fname):
+    global aircraft_view, flightblock_view, guided_view, waypoint_view, status_view, telemetry_rules, rule_index
     tree = ET.parse(fname)
     root = tree.getroot()
-    tmp_ac_id = 0   # Assuming all aircraft use the same flight plan, we cache an aircraft index
+    flightplan = empty_flightplan   # Assuming all aircraft use the same flight plan, we use the last aircraft's one
+    ac_items, fb_items, gd_items, wp_items, st_items = [], [], [], [], []
 
     # Populate aircraft client objects
+    ac_ids = set()
     for aircraft in root.findall('aircraft'):
         ac_id = int(aircraft.get('ac_id')) if aircraft.get('ac_id') else None
         name  = aircraft.get('name')
         if name: 
-            ac_id = next((idx for idx in aircrafts if aircrafts[idx].name == name), None)
-            #print("Found aircraft name: %s" % aircrafts[ac_id].name)
+            ac_id = aircraft_names.get(name)
+            if ac_id is None:
+                print("Unknown aircraft name in %s: %s" % (fname, name))
+                continue
+        if ac_id not in aircrafts:
+            print("Unknown aircraft id in %s: %s" % (fname, ac_id))
+            continue
+        if ac_id in ac_ids:
+            continue
+        ac_ids.add(ac_id)
         color = aircraft.get('color')
         if color:  #Override current conf.xml gui_color value if defined in frc_conf.xml
             aircrafts[ac_id].color = color
         # TODO: Add conf.xml colors to these structures if the color attribute is not specified in frc_conf.xml
-        view_attributelist_helper(aircraft, ac_color_list, ac_label_list, ac_icon_list, ac_tooltip_list)
-        aircraft_client_add(ac_id)
-        tmp_ac_id = ac_id  # Cache the current aircraft index for use in flightblock and waypoint search
+        ac_items.append(new_view_item(aircraft, ac_id, aircrafts[ac_id].name))
+        flightplan = aircrafts[ac_id].flightplan  # Cache the current aircraft flight plan for use in flightblock and waypoint search
 
     # Populate flightblock client objects
+    fb_ids = set()
     for flightblock in root.findall('flightblock'):
         fb_id = int(flightblock.get('fb_id')) if flightblock.get('fb_id') else None
         name = flightblock.get('name')
         if name: 
-            fb_id = next((idx for idx in aircrafts[tmp_ac_id].flightblocks if aircrafts[tmp_ac_id].flightblocks[idx].fb_name == name), None)
-            #print("Found flightblock name: %s" % aircrafts[tmp_ac_id].flightblocks[fb_id].fb_name)
-        view_attributelist_helper(flightblock, fb_color_list, fb_label_list, fb_icon_list, fb_tooltip_list)
-        flightblock_client_add(fb_id)
+            fb_id = flightplan.flightblock_index.get(name)
+            if fb_id is None:
+                print("Unknown flightblock name in %s: %s" % (fname, name))
+                continue
+        if fb_id not in flightplan.flightblocks:
+            print("Unknown flightblock id in %s: %s" % (fname, fb_id))
+            continue
+        if fb_id not in fb_ids:
+            fb_ids.add(fb_id)
+            fb_items.append(new_view_item(flightblock, fb_id, flightplan.flightblocks[fb_id].fb_name))
 
     # Populate guided client objects
     for guided in root.findall('guided'):
@@ -320,26 +1812,55 @@ def static_init_client_configuration_data(fname):
         #if name: 
             #gd_id = next((idx for idx in aircrafts[tmp_ac_id].guideds if aircrafts[tmp_ac_id].guideds[idx].gd_name == name), None)
             #print("Found guided name: %s" % aircrafts[tmp_ac_id].guideds[gd_id].gd_name)
-        view_attributelist_helper(guided, gd_color_list, gd_label_list, gd_icon_list, gd_tooltip_list)
-        #guided_client_add(gd_id)
+        gd_items.append(new_view_item(guided, gd_id, name or ''))
 
     # Populate waypoint client objects
+    wp_ids = set()
     for waypoint in root.findall('waypoint'):
         wp_id = int(waypoint.get('wp_id')) if waypoint.get('wp_id') else None
         name = waypoint.get('name')
         if name: 
-            wp_id = next((idx for idx in aircrafts[tmp_ac_id].waypoints if aircrafts[tmp_ac_id].waypoints[idx].wp_name == name), None)
-            #print("Found waypoint name: %s" % aircrafts[tmp_ac_id].waypoints[wp_id].wp_name)
-        view_attributelist_helper(waypoint, wp_color_list, wp_label_list, wp_icon_list, wp_tooltip_list)
-        waypoint_client_add(wp_id)
+            wp_id = flightplan.waypoint_index.get(name)
+            if wp_id is None:
+                print("Unknown waypoint name in %s: %s" % (fname, name))
+                continue
+        if wp_id not in flightplan.waypoints:
+            print("Unknown waypoint id in %s: %s" % (fname, wp_id))
+            continue
+        if wp_id not in wp_ids:
+            wp_ids.add(wp_id)
+            wp_items.append(new_view_item(waypoint, wp_id, flightplan.waypoints[wp_id].wp_name))
 
     # Populate status client objects
+    st_names = set()
     for status in root.findall('status'):
         st_name      = status.get('name')
         st_msg_name  = status.get('msg_name')
         st_msg_key   = status.get('msg_key')
-        view_attributelist_helper(status, st_color_list, st_label_list, st_icon_list, st_tooltip_list)
-        status_client_add(st_name, st_msg_name, st_msg_key)
+        if st_name in st_names:
+            continue
+        st_names.add(st_name)
+        st_items.append(new_view_item(status, st_name, st_name, st_msg_name, st_msg_key))
+
+    # Compile rule objects
+    rules = []
+    for rule in root.findall('rule'):
+        try:
+            rules.append(TelemetryRule(rule.attrib))
+        except ValueError as e:
+            print("Invalid rule in %s: %s" % (fname, e))
+
+    # Publish the views together so a concurrent render never mixes old and new views
+    with state_lock:
+        aircraft_view    = reuse_view(aircraft_view,    ClientView(ac_items))
+        flightblock_view = reuse_view(flightblock_view, ClientView(fb_items))
+        guided_view      = reuse_view(guided_view,      ClientView(gd_items))
+        waypoint_view    = reuse_view(waypoint_view,    ClientView(wp_items))
+        status_view      = reuse_view(status_view,      ClientView(st_items))
+        telemetry_rules  = rules
+        rule_index       = new_rule_index(rules)
+    warm_rule_settings(rules)
+
 
     # Populate layout client objects
     for layout in root.findall('layout'):
@@ -350,37 +1871,294 @@ def static_init_client_configuration_data(fname):
         add_new_layout(name, rows, cols)
     
 
+def parse_flightplan(path):
+    parser = ET.XMLParser(recover=True)
+    fptree = ET.parse(path, parser) 
+    fproot = fptree.getroot()
+    # Process waypoints
+    # Populate WP_dummy, idx=0, x="42.0" and y="42.0"; note: used values defined in gen_flight_plan.ml
+    waypoints = { 0: Waypoint(0, "dummy", "42.0", "42.0") }
+    # Waypoints indexes are adjusted by 1 to account for dummy waypoint above
+    for idx, waypoint in enumerate(fproot.iter('waypoint')):
+        waypoints[idx+1] = Waypoint(idx+1, waypoint.get('name'), waypoint.get('x'), waypoint.get('y'))
+    # Process flightblocks
+    flightblocks = {}
+    for idx, block in enumerate(fproot.iter('block')):
+        flightblocks[idx] = Flightblock(idx, block.get('name'))
+    # Origin of the local coordinates
+    try:
+        reference = (float(fproot.get('lat0')), float(fproot.get('lon0')), float(fproot.get('ground_alt', 0.0)))
+    except (TypeError, ValueError):
+        reference = None
+    return FlightPlan(path, waypoints, flightblocks, reference)
+
 def static_init_configuration_data():
+    global aircrafts, aircraft_names
     tree = ET.parse(os.path.join( PPRZ_SRC_CONF, 'conf.xml' ))
     root = tree.getroot()
+    flightplans = {}   # flight plan path -> FlightPlan, swarms usually share a handful of flight plans
+    acs         = {}
+    names       = {}
 
     # Populate aircraft objects
     for aircraft in root.findall('aircraft'):
         acid           = int(aircraft.get('ac_id'))
         name           = aircraft.get('name')
-        flightplanpath = aircraft.get('flight_plan')
+        flightplanpath = os.path.join( PPRZ_SRC_CONF, aircraft.get('flight_plan') )
         #airframepath   = aircraft.get('airframe')
         color          = aircraft.get('gui_color')
-        add_new_aircraft(acid, name, color)
-        aircraft = aircrafts[acid]
     
         # Populate flight plan objects
-        parser = ET.XMLParser(recover=True)
-        fptree = ET.parse(os.path.join( PPRZ_SRC_CONF, flightplanpath ), parser) 
-        fproot = fptree.getroot()
-        # Process waypoints
-        # Populate WP_dummy, idx=0, x="42.0" and y="42.0"; note: used values defined in gen_flight_plan.ml
-        add_new_aircraft_waypoint(aircraft, 0, "dummy", "42.0", "42.0")
-        # Waypoints indexes are adjusted by 1 to account for dummy waypoint above
-        for idx, waypoint in enumerate(fproot.iter('waypoint')):
-            name = waypoint.get('name')
-            px   = waypoint.get('x')
-            py   = waypoint.get('y')
-            add_new_aircraft_waypoint(aircraft, idx+1, name, px, py)
-        # Process flightblocks
-        for idx, block in enumerate(fproot.iter('block')):
-            name = block.get('name')
-            add_new_aircraft_flightblock(aircraft, idx, name)
+        flightplan = flightplans.get(flightplanpath)
+        if flightplan is None:
+            flightplan = flightplans[flightplanpath] = parse_flightplan(flightplanpath)
+        acs[acid] = Aircraft(acid, name, color, flightplan)
+        names.setdefault(name, acid)
+
+    # Publish all aircraft at once rather than copying the aircraft dict once per aircraft
+    with state_lock:
+        acs.update( (ac_id, aircrafts[ac_id]) for ac_id in aircrafts if ac_id not in acs )
+        aircrafts      = acs
+        aircraft_names = names
+
+
+# --- Startup snapshot related state/methods
+
+# The snapshot holds plain tuples/lists/dicts written with marshal, which loads much faster than unpickling
+# thousands of Waypoint/Flightblock objects; marshal data is only readable by the same python version
+snapshot_version = (3, sys.version_info[:2])
+
+def get_file_signature(path, previous=None):
+    # (modification time, size, sha1); the file is hashed only if mtime/size differ from the previous signature
+    stat = os.stat(path)
+    if previous is not None and previous[0] == stat.st_mtime and previous[1] == stat.st_size:
+        return previous
+    with open(path, 'rb') as f:
+        return (stat.st_mtime, stat.st_size, hashlib.sha1(f.read()).hexdigest())
+
+def view_to_tuples(view):
+    return [ (item.item_id, item.name, item.color, item.label, item.icon, item.tooltip, item.msg_name, item.msg_key)
+             for item in view.items ]
+
+def save_snapshot(snapshot_file, fname):
+    try:
+        flightplans = {}
+        for ac_id in aircrafts:
+            flightplan = aircrafts[ac_id].flightplan
+            if flightplan.path and flightplan.path not in flightplans:
+                flightplans[flightplan.path] = (
+                    [ (wp.wp_id, wp.wp_name, wp.wp_x, wp.wp_y) for wp in flightplan.waypoints.values() ],
+                    [ (fb.fb_id, fb.fb_name) for fb in flightplan.flightblocks.values() ],
+                    flightplan.reference)
+        sources = [ os.path.join( PPRZ_SRC_CONF, 'conf.xml' ), os.path.abspath(fname) ] + list(flightplans)
+        current = layout.get(0)
+        snapshot = { 'version':     snapshot_version,
+                     'sources':     dict( (path, get_file_signature(path)) for path in sources ),
+                     'flightplans': flightplans,
+                     'aircrafts':   [ (ac_id, aircrafts[ac_id].name, aircrafts[ac_id].color, aircrafts[ac_id].flightplan.path)
+                                      for ac_id in aircrafts ],
+                     'names':       aircraft_names,
+                     'views':       [ view_to_tuples(view) for view in (aircraft_view, flightblock_view, guided_view, waypoint_view, status_view) ],
+                     'layout':      (current.name, current.rows, current.cols) if current is not None else None,
+                     'rules':       [ rule.attrs for rule in telemetry_rules ],
+                     'settings':    dict(settings_cache) }
+        # Write to a temporary file first so an interrupted save never leaves a truncated snapshot behind
+        with open(snapshot_file + '.tmp', 'wb') as f:
+            marshal.dump(snapshot, f)
+        os.rename(snapshot_file + '.tmp', snapshot_file)
+    except Exception as e:
+        print("Startup snapshot not saved: %s" % e)
+
+def load_snapshot(snapshot_file, fname):
+    # Returns True if the aircraft, flight plan and client data were restored from an up to date snapshot
+    global aircrafts, aircraft_names, aircraft_view, flightblock_view, guided_view, waypoint_view, status_view
+    global telemetry_rules, rule_index
+    try:
+        with open(snapshot_file, 'rb') as f:
+            snapshot = marshal.load(f)
+        if snapshot['version'] != snapshot_version or os.path.abspath(fname) not in snapshot['sources']:
+            return False
+        for path, signature in snapshot['sources'].items():
+            if get_file_signature(path, signature)[2] != signature[2]:
+                return False
+    except Exception:
+        return False   # Missing, unreadable or outdated snapshot, or a source file is gone: do a full parse
+    flightplans = { None: empty_flightplan }
+    for path, (waypoints, flightblocks, reference) in snapshot['flightplans'].items():
+        flightplans[path] = FlightPlan(path, dict( (wp[0], Waypoint(*wp)) for wp in waypoints ),
+                                             dict( (fb[0], Flightblock(*fb)) for fb in flightblocks ), reference)
+    acs   = dict( (ac[0], Aircraft(ac[0], ac[1], ac[2], flightplans[ac[3]])) for ac in snapshot['aircrafts'] )
+    views = [ ClientView( ViewItem(*item) for item in items ) for items in snapshot['views'] ]
+    rules = [ TelemetryRule(attrs) for attrs in snapshot['rules'] ]
+    with state_lock:
+        aircrafts      = acs
+        aircraft_names = snapshot['names']
+        aircraft_view, flightblock_view, guided_view, waypoint_view, status_view = views
+        telemetry_rules = rules
+        rule_index      = new_rule_index(rules)
+        if snapshot['layout'] is not None:
+            layout[0] = Layout(*snapshot['layout'])
+    settings_cache.update(snapshot['settings'])   # Entries are still checked against the settings.xml mtime
+    warm_rule_settings(rules)
+    return True
+
+
+# --- Configuration hot reload related state/methods
+
+class ConfigWatcher(object):
+    # Polls the client configuration file and the flight plans, and re-applies the changed ones to the live state
+    def __init__(self, interval):
+        self.interval   = interval
+        self.fname      = None
+        self.signatures = {}   # path -> file signature when last applied
+
+    def watched_paths(self):
+        paths = set( aircrafts[ac_id].flightplan.path for ac_id in aircrafts if aircrafts[ac_id].flightplan.path )
+        paths.add(self.fname)
+        return paths
+
+    def changed_paths(self):
+        changed = []
+        for path in self.watched_paths():
+            previous = self.signatures.get(path)
+            try:
+                signature = get_file_signature(path, previous)
+            except OSError:
+                continue   # Moved away or being rewritten, try again on the next poll
+            # A touched file with the same content(sha1) is not reloaded
+            if previous is not None and signature[2] != previous[2]:
+                changed.append(path)
+            self.signatures[path] = signature
+        return changed
+
+    def reload_flightplan(self, path):
+        global aircrafts
+        flightplan = parse_flightplan(path)
+        with state_lock:
+            for ac_id in aircrafts:
+                if aircrafts[ac_id].flightplan.path == path:
+                    aircrafts[ac_id].set_flightplan(flightplan)
+            aircrafts = dict(aircrafts)   # Rebind so the documents built from the aircraft dict are rebuilt
+        print("Reloaded flight plan: %s" % path)
+
+    def reload(self, changed):
+        global aircrafts
+        for path in changed:
+            if path != self.fname:
+                self.reload_flightplan(path)
+        # Flightblock and waypoint names in the client configuration may resolve to other ids in a changed flight plan,
+        # so the client configuration is re-applied either way; views that come out the same are kept, and with
+        # them the rendered pages that use them
+        columns = status_view
+        static_init_client_configuration_data(self.fname)
+        with state_lock:
+            aircrafts = dict(aircrafts)   # Aircraft colors may have changed
+        ivy_subscription.update()         # Status columns or rules may have changed
+        if status_view is not columns:
+            status_stream.reset(aircrafts, status_view.msg_index)
+        print("Reloaded client configuration: %s" % self.fname)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                changed = self.changed_paths()
+                if changed:
+                    self.reload(changed)
+            except Exception as e:
+                print("Configuration reload failed: %s" % e)   # Keep serving the previous configuration
+
+    def start(self, fname):
+        self.fname = os.path.abspath(fname)
+        self.changed_paths()   # Record the signatures of the configuration in use
+        thread = threading.Thread(target=self.run, name="ConfigWatcher")
+        thread.daemon = True
+        thread.start()
+
+config_watcher = ConfigWatcher(2.0)
+
+
+# --- Ivy subscription related state/methods
+
+message_name_pattern = re.compile(r'^\w+$')   # Other names can not match a message, and are kept out of the regex
+
+class IvySubscription(object):
+    # Binds the ivy bus to the messages somebody uses(status view columns, telemetry waiters and the messages added
+    # by route for the history/health routes, and the rules), so the other messages are dropped by the ivy regex before they are
+    # parsed and decoded. The binding is replaced when the set of message names grows or shrinks.
+    def __init__(self):
+        self.lock     = threading.Lock()
+        self.callback = None
+        self.bind_id  = None
+        self.names    = None        # Message names of the current binding, None if bound to every message
+        self.added    = set()       # Message names added by route
+        self.all      = False
+
+    def wanted(self):
+        names = set(status_view.msg_index) | self.added
+        names.update(rule_index)
+        names.update(command_tracer.messages)
+        if separation_monitor.running:
+            names.add('GPS_INT')
+        with telemetry_waiter_lock:
+            names.update( msg_name for ac_id, msg_name in telemetry_waiters )
+        return frozenset( name for name in names if message_name_pattern.match(name) )
+
+    def regex(self, names):
+        # Group 1 must be the whole ivy message(sender, message name and fields) to be parsed by pprzlink
+        return '^(\\S+ (?:%s) .*)' % '|'.join(sorted(names))
+
+    def update(self):
+        with self.lock:
+            if self.callback is None or self.all:
+                return
+            names = self.wanted()
+            if names == self.names:
+                return
+            bind_id = ivy_interface.subscribe(self.callback, self.regex(names)) if names else None
+            if self.bind_id is not None:   # Unbind after binding the new set, so no wanted message is missed
+                ivy_interface.unsubscribe(self.bind_id)
+            self.bind_id = bind_id
+            self.names   = names
+        if verbose:
+            print("Ivy subscription: %s" % ' '.join(sorted(names)))
+
+    def bound(self, msg_name):
+        names = self.names
+        return self.all or (names is not None and msg_name in names)
+
+    def add(self, msg_name):
+        self.added.add(msg_name)
+        self.update()
+
+    def ensure(self, msg_name):
+        # Called by the read routes for a message they found no record of: binds a telemetry message nobody
+        # subscribed to, so it is received from now on. Returns False if the message was not bound before.
+        with self.lock:
+            if self.callback is None or self.all or msg_name in (self.names or ()):
+                return True
+        if not message_name_pattern.match(msg_name):
+            return True
+        try:
+            PprzMessage("telemetry", msg_name)
+        except Exception:
+            return True   # Not a telemetry message, left to the route to report
+        self.add(msg_name)
+        return False
+
+    def start(self, callback, subscribe_all=False):
+        self.callback = callback
+        if subscribe_all:
+            with self.lock:
+                self.all     = True
+                self.bind_id = ivy_interface.subscribe(callback)
+            return
+        self.update()
+
+    def to_dict(self):
+        return {'all': self.all, 'msg_names': sorted(self.names or []), 'added': sorted(self.added)}
+
+ivy_subscription = IvySubscription()
 
 
 def callback_aircraft_messages(ac_id, msg):
@@ -388,11 +2166,27 @@ def callback_aircraft_messages(ac_id, msg):
     if ac_id not in aircrafts:
         add_new_aircraft(ac_id, 'unknown', 'unknown')
     aircraft = aircrafts[ac_id]
-    # Add the messages and say when last seen
-    add_new_aircraft_message(aircraft, msg.msg_class, msg.name,msg)
-    aircrafts[ac_id].messages[msg.name].last_seen = time.time()
-    for index in range(0, len(msg.fieldvalues)):
-        aircraft.messages[msg.name].field_controls[index]=msg.get_field(index)
+    # Update the message record in place(add it on first receipt), decode the fields and say when last seen
+    now     = time.time()
+    message = aircraft.messages.get(msg.name)
+    if message is None:
+        message = add_new_aircraft_message(aircraft, msg.msg_class, msg.name, msg, now)
+    else:
+        message.update(msg, now)
+    update_aircraft_history(aircraft, msg.name, message.field_values, now)
+    if msg.name == 'GPS_INT' and separation_monitor.running:
+        separation_monitor.update(ac_id, message.field_values, now)
+    # Wake up the missions waiting on this message
+    if (ac_id, msg.name) in telemetry_waiters:
+        check_telemetry_waiters(ac_id, msg.name, message.field_values)
+    # Evaluate the rules that read this message
+    keys = rule_index.get(msg.name)
+    if keys:
+        check_telemetry_rules(keys, ac_id, message.field_values, now)
+    # Push changed status cells to the status stream subscribers
+    columns = status_view.msg_index.get(msg.name)
+    if columns:
+        status_stream.update(ac_id, columns, message)
 
 
 # --- Routes/Paths ----
@@ -440,20 +2234,31 @@ def aircraft(ac_id):
 @app.route('/aircraft/client/')
 def aircraft_client_all():
     if curl: print_curl_format()
-    return str(aircraft_client_list)
+    return str(aircraft_view.ids)
 
 
 @app.route('/aircraft/client/add/<int:ac_id>')
 def aircraft_client_add(ac_id):
+    global aircraft_view
     ac_id = int(ac_id)
     if ac_id in aircrafts:
-        if ac_id not in aircraft_client_list:       
-            aircraft_client_list.append(ac_id)
+        with state_lock:
+            if ac_id not in aircraft_view.index:       
+                aircraft_view = aircraft_view.add(aircraft_view.item(len(aircraft_view)).styled(ac_id, aircrafts[ac_id].name))
+            view = aircraft_view
         if curl: print_curl_format()
-        return str(aircraft_client_list)    
+        return str(view.ids)    
     return "unknown aircraft id"    
 
 
+@app.route('/aircraft/client/add/<ac_name>')
+def aircraft_client_add_byname(ac_name):
+    ac_id = aircraft_names.get(ac_name)
+    if ac_id is None:
+        return "unknown aircraft name"
+    return aircraft_client_add(ac_id)
+
+
 @app.route('/flightblock/noop/')
 def flightblock_noop():
     if curl: print_curl_format()
@@ -463,55 +2268,89 @@ def flightblock_noop():
 @app.route('/flightblock/client/')
 def flightblock_client_all():
     if curl: print_curl_format()
-    return str(flightblock_client_list)
+    return str(flightblock_view.ids)
 
 
 @app.route('/flightblock/client/add/<int:fb_id>')
 def flightblock_client_add(fb_id):
-    if aircraft_client_list:
+    global flightblock_view
+    if aircraft_view.ids:
         fb_id = int(fb_id)
-        if fb_id in aircrafts[aircraft_client_list[0]].flightblocks:  # KLUDGE: Use first defined aircraft's flightblocks to verify, assume all aircraft use same flight plan
-            if fb_id not in flightblock_client_list:       
-                flightblock_client_list.append(fb_id)
+        flightblocks = aircrafts[aircraft_view.ids[0]].flightblocks  # KLUDGE: Use first defined aircraft's flightblocks to verify, assume all aircraft use same flight plan
+        if fb_id in flightblocks:
+            with state_lock:
+                if fb_id not in flightblock_view.index:       
+                    flightblock_view = flightblock_view.add(flightblock_view.item(len(flightblock_view)).styled(fb_id, flightblocks[fb_id].fb_name))
+                view = flightblock_view
             if curl: print_curl_format()
-            return str(flightblock_client_list)    
+            return str(view.ids)    
         return "unknown flightblock id"
     return "aircraft list is empty"    
 
 
+@app.route('/flightblock/client/add/<fb_name>')
+def flightblock_client_add_byname(fb_name):
+    if aircraft_view.ids:
+        fb_id = aircrafts[aircraft_view.ids[0]].flightplan.flightblock_index.get(fb_name)  # KLUDGE: assume all aircraft use same flight plan
+        if fb_id is None:
+            return "unknown flightblock name"
+        return flightblock_client_add(fb_id)
+    return "aircraft list is empty"    
+
+
 @app.route('/waypoint/client/')
 def waypoint_client_all():
     if curl: print_curl_format()
-    return str(waypoint_client_list)
+    return str(waypoint_view.ids)
 
 
 @app.route('/waypoint/client/add/<int:wp_id>')
 def waypoint_client_add(wp_id):
-    if aircraft_client_list:
+    global waypoint_view
+    if aircraft_view.ids:
         wp_id = int(wp_id)
-        if wp_id in aircrafts[aircraft_client_list[0]].waypoints:  # KLUDGE: Use first defined aircraft's waypoints to verify, assume all aircraft use same flight plan
-            if wp_id not in waypoint_client_list:       
-                waypoint_client_list.append(wp_id)
+        waypoints = aircrafts[aircraft_view.ids[0]].waypoints  # KLUDGE: Use first defined aircraft's waypoints to verify, assume all aircraft use same flight plan
+        if wp_id in waypoints:
+            with state_lock:
+                if wp_id not in waypoint_view.index:       
+                    waypoint_view = waypoint_view.add(waypoint_view.item(len(waypoint_view)).styled(wp_id, waypoints[wp_id].wp_name))
+                view = waypoint_view
             if curl: print_curl_format()
-            return str(waypoint_client_list)    
+            return str(view.ids)    
         return "unknown waypoint id"
     return "aircraft list is empty"    
 
 
+@app.route('/waypoint/client/add/<wp_name>')
+def waypoint_client_add_byname(wp_name):
+    if aircraft_view.ids:
+        wp_id = aircrafts[aircraft_view.ids[0]].flightplan.waypoint_index.get(wp_name)  # KLUDGE: assume all aircraft use same flight plan
+        if wp_id is None:
+            return "unknown waypoint name"
+        return waypoint_client_add(wp_id)
+    return "aircraft list is empty"    
+
+
+def status_client_format(view):
+    return str(view.ids) + str([ item.msg_name for item in view.items ]) + str([ item.msg_key for item in view.items ])
+
+
 @app.route('/status/client/')
 def status_client_all():
     if curl: print_curl_format()
-    return str(status_client_list) + str(status_client_list_msg_name) + str(status_client_list_msg_key)
+    return status_client_format(status_view)
 
 
 @app.route('/status/client/add/<st_name>/<st_msg_name>/<st_msg_key>')
 def status_client_add(st_name, st_msg_name, st_msg_key):
-    if st_name not in status_client_list:       
-        status_client_list.append(st_name)
-        status_client_list_msg_name.append(st_msg_name)
-        status_client_list_msg_key.append(st_msg_key)
+    global status_view
+    with state_lock:
+        if st_name not in status_view.index:       
+            status_view = status_view.add(status_view.item(len(status_view)).styled(st_name, st_name, st_msg_name, st_msg_key))
+        view = status_view
+    ivy_subscription.update()
     if curl: print_curl_format()
-    return str(status_client_list) + str(status_client_list_msg_name) + str(status_client_list_msg_key)   
+    return status_client_format(view)   
 
 
 @app.route('/message/<int:ac_id>')
@@ -533,7 +2372,9 @@ def message_byname(ac_id, messagename):
     if ac_id in aircrafts:
         if messagename in aircrafts[ac_id].messages:
             if curl: print_curl_format()
-            return Response( str(aircrafts[ac_id].messages[messagename].latest_msg.to_json()) )
+            return Response( get_aircraft_message_json(aircrafts[ac_id].messages[messagename]) )
+        elif not ivy_subscription.ensure(messagename):
+            return "message not subscribed"
         else:
             return "unknown message name"
     else:
@@ -542,33 +2383,113 @@ def message_byname(ac_id, messagename):
 
 @app.route('/message/<int:ac_id>/<messagename>/<messagekey>')
 def message_byattribute(ac_id, messagename, messagekey):
-    # If the message is valid, return the latest message
-    status_val = ''
+    # If the message is valid, return the latest message field value
     ac_id = int(ac_id)
-    if ac_id in aircrafts:
-        if messagename in aircrafts[ac_id].messages:
-            if messagekey in aircrafts[ac_id].messages[messagename].latest_msg.to_json():
-                if curl: print_curl_format()
-                messagevalue = json.loads(aircrafts[ac_id].messages[messagename].latest_msg.to_json())
-                status_val = str(messagevalue[messagekey])
+    if ac_id in aircrafts and messagename not in aircrafts[ac_id].messages and not ivy_subscription.ensure(messagename):
+        return "message not subscribed"
+    status_val = get_aircraft_message_value(ac_id, messagename, messagekey)
+    if status_val and curl: print_curl_format()
     return Response( status_val )
 
 
 @app.route('/message/<messagename>/<messagekey>')
 def message_all_byattribute(messagename, messagekey):
+    ivy_subscription.ensure(messagename)   # The list keeps its shape, with '' until the message is received
     messagelist = []
-    for ac in aircraft_client_list:
-        status_val = ''
-    	ac_id = int(ac)
-        if messagename in aircrafts[ac_id].messages:
-            if messagekey in aircrafts[ac_id].messages[messagename].latest_msg.to_json():
-                messagevalue = json.loads(aircrafts[ac_id].messages[messagename].latest_msg.to_json())
-                status_val = str(messagevalue[messagekey])
-        messagelist.append( status_val )
+    for ac_id in aircraft_view.ids:
+        messagelist.append( get_aircraft_message_value(ac_id, messagename, messagekey) )
     if curl: print_curl_format()
     return Response( str(json.dumps(messagelist)) )
 
 
+@app.route('/history/<int:ac_id>/<messagename>/<messagekey>')
+def history_byattribute(ac_id, messagename, messagekey):
+    # Return the [time, value] samples received after the since(seconds since the epoch) URL parameter
+    since = request.args.get('since', 0.0, type=float)
+    if ac_id in aircrafts:
+        history = aircrafts[ac_id].history.get(messagename)
+        if history is not None and messagekey in history.values:
+            if curl: print_curl_format()
+            return Response( json.dumps(history.query(messagekey, since)), mimetype='application/json' )
+        if messagename not in aircrafts[ac_id].history and not ivy_subscription.ensure(messagename):
+            return "message not subscribed"
+        return "unknown message name or key"
+    return "unknown aircraft id"
+
+
+@app.route('/health/')
+def health_all():
+    now = time.time()
+    healthlist = {}
+    for ac_id in aircrafts:
+        messages = aircrafts[ac_id].messages
+        healthlist[ac_id] = dict( (name, messages[name].health(now)) for name in messages )
+    if curl: print_curl_format()
+    return Response( json.dumps(healthlist), mimetype='application/json' )
+
+
+@app.route('/health/<int:ac_id>')
+def health(ac_id):
+    if ac_id in aircrafts:
+        now = time.time()
+        messages = aircrafts[ac_id].messages
+        if curl: print_curl_format()
+        return Response( json.dumps(dict( (name, messages[name].health(now)) for name in messages )), mimetype='application/json' )
+    return "unknown aircraft id"
+
+
+@app.route('/sendqueue/')
+def sendqueue():
+    if curl: print_curl_format()
+    return Response( json.dumps(send_queue.to_dict()), mimetype='application/json' )
+
+
+@app.route('/subscription/')
+def subscription():
+    if curl: print_curl_format()
+    return Response( json.dumps(ivy_subscription.to_dict()), mimetype='application/json' )
+
+
+# Receive a message that no status column or mission uses, e.g. for the history/ and health/ routes
+@app.route('/subscription/add/<msg_name>')
+def subscription_add(msg_name):
+    ivy_subscription.add(msg_name)
+    if curl: print_curl_format()
+    return Response( json.dumps(ivy_subscription.to_dict()), mimetype='application/json' )
+
+
+@app.route('/rules/')
+def rules_all():
+    if curl: print_curl_format()
+    return Response( json.dumps([ rule.to_dict() for rule in telemetry_rules ]), mimetype='application/json' )
+
+
+@app.route('/latency/')
+def latency_all():
+    if curl: print_curl_format()
+    return Response( json.dumps(command_tracer.to_dict()), mimetype='application/json' )
+
+
+@app.route('/latency/<int:ac_id>')
+def latency(ac_id):
+    if ac_id in aircrafts:
+        if curl: print_curl_format()
+        return Response( json.dumps(command_tracer.to_dict(ac_id)), mimetype='application/json' )
+    return "unknown aircraft id"
+
+
+@app.route('/separation/')
+def separation():
+    if curl: print_curl_format()
+    return Response( json.dumps(separation_monitor.to_dict()), mimetype='application/json' )
+
+
+@app.route('/stream/status/')
+def stream_status():
+    if curl: print_curl_format()
+    return Response( status_stream.frames(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'} )
+
+
 @app.route('/guidance/')
 def guidance_all():
     retval = ''
@@ -584,28 +2505,16 @@ def guidance_all():
 def guidance_setmode_all_aircraft(value):
     retval = ''
 
-    for ac_id in aircraft_client_list:
-        try:
-            settings = PaparazziACSettings(ac_id)
-        except Exception as e:
-            print(e)
-            return
-        try:
-            index = settings.name_lookup['auto2'].index
-        except Exception as e:
-            print(e)
-            print("auto2 setting not found, mode change not possible.")
-            return
-
-        if index is not None:
-            msg = PprzMessage("ground", "DL_SETTING")
-            msg['ac_id'] = ac_id
-            msg['index'] = index
-            msg['value'] = value
-            if verbose: 
-                print_ivy_trace(msg)
-                retval = 'Guidance Mode All Aircraft: index=%d, value=%d\n' % (index, value)
-            ivy_interface.send(msg)
+    msglist = []
+    for ac_id in aircraft_view.ids:
+        index = get_auto2_index(ac_id)
+        if index is None:
+            return "auto2 setting not found, mode change not possible"
+        msglist.append( new_setting_message(ac_id, index, value) )
+        if verbose: 
+            retval = 'Guidance Mode All Aircraft: index=%d, value=%d\n' % (index, value)
+    if not send_messages(msglist):
+        return send_queue_full()
     if curl: print_curl_format()
     return retval
 
@@ -615,47 +2524,55 @@ def guidance_setmode_all_aircraft(value):
 def guidance_setmode(ac_id, value):
     retval = ''
 
-    try:
-        settings = PaparazziACSettings(ac_id)
-    except Exception as e:
-        print(e)
-        return
-    try:
-        index = settings.name_lookup['auto2'].index
-    except Exception as e:
-        print(e)
-        print("auto2 setting not found, mode change not possible.")
-        return
+    index = get_auto2_index(ac_id)
+    if index is None:
+        return "auto2 setting not found, mode change not possible"
 
-    if index is not None:
-        msg = PprzMessage("ground", "DL_SETTING")
-        msg['ac_id'] = ac_id
-        msg['index'] = index
-        msg['value'] = value
-        if verbose: 
-            print_ivy_trace(msg)
-            retval = 'Guidance mode: ac_id=%d, index=%d, value=%d\n' % (ac_id, index, value)
-        ivy_interface.send(msg)
+    if not send_message( new_setting_message(ac_id, index, value) ):
+        return send_queue_full()
+    if verbose: 
+        retval = 'Guidance mode: ac_id=%d, index=%d, value=%d\n' % (ac_id, index, value)
+    if curl: print_curl_format()
+    return retval
+
+
+# Stream newline delimited json setpoints, e.g. {"ac_id": 217, "flags": 0, "x": 1.0, "y": 0.0, "z": 0.0, "yaw": 0.0},
+# in the body of a single POST request; each line is handled as soon as it is received
+@app.route('/guidance/stream/', methods=['GET', 'POST'])
+def guidance_stream_all():
+    if request.method == 'POST':
+        lines    = 0
+        rejected = 0
+        errors   = []
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            lines += 1
+            try:
+                ac_ids, setpoint = parse_guidance_setpoint(line.decode('utf-8'))
+            except ValueError as e:
+                rejected += 1
+                if len(errors) < 10:   # Report the first errors only
+                    errors.append("line %d: %s" % (lines, e))
+                continue
+            guidance_stream.put(ac_ids, setpoint)
+        guidance_stream.rejected += rejected
         if curl: print_curl_format()
-        return retval
+        return Response( json.dumps({'lines': lines, 'rejected': rejected, 'errors': errors}), mimetype='application/json' )
+    if curl: print_curl_format()
+    return Response( json.dumps(guidance_stream.to_dict()), mimetype='application/json' )
 
 
 @app.route('/guidance/<int:flag>/<x>/<y>/<z>/<yaw>')
 def guidance_all_aircraft(flag, x, y, z, yaw):
     retval = ''
 
-    for ac_id in aircraft_client_list:
-        msg = PprzMessage("datalink", "GUIDED_SETPOINT_NED")
-        msg['ac_id'] = ac_id
-        msg['flags'] = flag
-        msg['x']     = x
-        msg['y']     = y
-        msg['z']     = z
-        msg['yaw']   = yaw
-        if verbose: 
-            print_ivy_trace(msg)
-            retval = 'Guidance All Aircraft: flag=%d, x=%s, y=%s, z=%s, yaw=%s\n' % (flag, x, y, z, yaw)
-        ivy_interface.send_raw_datalink(msg)
+    msglist = [ new_guidance_message(ac_id, flag, x, y, z, yaw) for ac_id in aircraft_view.ids ]
+    if not send_messages(msglist):
+        return send_queue_full()
+    if verbose and msglist: 
+        retval = 'Guidance All Aircraft: flag=%d, x=%s, y=%s, z=%s, yaw=%s\n' % (flag, x, y, z, yaw)
     if curl: print_curl_format()
     return retval
 
@@ -664,17 +2581,10 @@ def guidance_all_aircraft(flag, x, y, z, yaw):
 def guidance(ac_id, flag, x, y, z, yaw):
     retval = ''
 
-    msg = PprzMessage("datalink", "GUIDED_SETPOINT_NED")
-    msg['ac_id'] = ac_id
-    msg['flags'] = flag
-    msg['x']     = x
-    msg['y']     = y
-    msg['z']     = z
-    msg['yaw']   = yaw
+    if not send_message( new_guidance_message(ac_id, flag, x, y, z, yaw) ):
+        return send_queue_full()
     if verbose: 
-        print_ivy_trace(msg)
         retval = 'Guidance: ac_id=%d, flag=%d, x=%s, y=%s, z=%s, yaw=%s\n' % (ac_id, flag, x, y, z, yaw)
-    ivy_interface.send_raw_datalink(msg)
     if curl: print_curl_format()
     return retval
 
@@ -693,35 +2603,122 @@ def waypoint_all():
 def waypoint_all_aircraft(wp_id, lat, lon, alt):
     retval = ''
 
-    for ac_id in aircraft_client_list:
-        msg = PprzMessage("ground", "MOVE_WAYPOINT")
-        msg['ac_id'] = ac_id
-        msg['wp_id'] = wp_id
-        msg['lat']   = lat
-        msg['long']  = lon
-        msg['alt']   = alt
-        if verbose: 
-            print_ivy_trace(msg)
-            retval = 'Waypoint All Aircraft: wp_id=%d, lat=%s, lon=%s, alt=%s\n' % (wp_id, lat, lon, alt)
-        ivy_interface.send(msg)
+    msglist = [ new_waypoint_message(ac_id, wp_id, lat, lon, alt) for ac_id in aircraft_view.ids ]
+    if not send_messages(msglist):
+        return send_queue_full()
+    if verbose and msglist: 
+        retval = 'Waypoint All Aircraft: wp_id=%d, lat=%s, lon=%s, alt=%s\n' % (wp_id, lat, lon, alt)
+    if curl: print_curl_format()
+    return retval
+
+
+# Move a waypoint of every client aircraft(or of the ac_id URL parameter only) to its place in a formation
+# centered at lat/lon, e.g. /waypoint/formation/grid/8/45.5642/-122.6222/61.0?spacing=10&heading=0
+@app.route('/waypoint/formation/<shape>/<int:wp_id>/<lat>/<lon>/<alt>')
+def waypoint_formation(shape, wp_id, lat, lon, alt):
+    retval = ''
+
+    if numpy is None:
+        return "formation requires numpy"
+    if shape not in formation_shapes:
+        return Response( "unknown formation shape, expected one of %s" % list(formation_shapes), status=400 )
+    try:
+        lat, lon, alt = float(lat), float(lon), float(alt)
+        spacing = float(request.args.get('spacing', 10.0))
+        heading = float(request.args.get('heading', 0.0))
+    except ValueError:
+        return Response( "invalid lat, lon, alt, spacing or heading", status=400 )
+    if not spacing > 0.0:
+        return Response( "spacing must be positive", status=400 )
+    ac_ids  = list(aircraft_view.ids)
+    msglist = new_formation_messages(ac_ids, wp_id, shape, lat, lon, alt, spacing, heading) if ac_ids else []
+    if 'ac_id' in request.args:
+        ac_id = request.args.get('ac_id', type=int)
+        if ac_id not in ac_ids:
+            return "unknown aircraft id"
+        msglist = [ msglist[ac_ids.index(ac_id)] ]
+    if not send_messages(msglist):
+        return send_queue_full()
+    if verbose and msglist: 
+        retval = 'Waypoint Formation: shape=%s, wp_id=%d, aircraft=%d, spacing=%.1f\n' % (shape, wp_id, len(msglist), spacing)
+    if curl: print_curl_format()
+    return retval
+
+
+# Move a waypoint to east/north/up meters from the flight plan origin(lat0, lon0, ground_alt)
+@app.route('/waypoint/enu/<int:ac_id>/<int:wp_id>/<east>/<north>/<up>')
+def waypoint_enu(ac_id, wp_id, east, north, up):
+    retval = ''
+
+    try:
+        points = new_local_points([ {'ac_id': ac_id, 'wp_id': wp_id, 'east': east, 'north': north, 'up': up} ])
+    except ValueError as e:
+        return Response( str(e), status=400 )
+    if not send_messages( new_local_waypoint_messages(points) ):
+        return send_queue_full()
+    if verbose: 
+        retval = 'Waypoint ENU: ac_id=%d, wp_id=%d, east=%s, north=%s, up=%s\n' % (ac_id, wp_id, east, north, up)
+    if curl: print_curl_format()
+    return retval
+
+
+@app.route('/waypoint/enu/<int:wp_id>/<east>/<north>/<up>')
+def waypoint_enu_all_aircraft(wp_id, east, north, up):
+    retval = ''
+
+    try:
+        points = new_local_points([ {'wp_id': wp_id, 'east': east, 'north': north, 'up': up} ])
+    except ValueError as e:
+        return Response( str(e), status=400 )
+    if not send_messages( new_local_waypoint_messages(points) ):
+        return send_queue_full()
+    if verbose and points: 
+        retval = 'Waypoint ENU All Aircraft: wp_id=%d, east=%s, north=%s, up=%s\n' % (wp_id, east, north, up)
     if curl: print_curl_format()
     return retval
 
 
+# Move many waypoints, e.g. [{"ac_id": 215, "wp_id": 8, "east": 10.0, "north": -5.0, "up": 20.0}, ...], in a single burst
+@app.route('/waypoint/enu/', methods=['POST'])
+def waypoint_enu_batch():
+    retval = ''
+
+    pointlist = request.get_json(force=True, silent=True)
+    if not isinstance(pointlist, list):
+        return Response( "points must be a json list of points", status=400 )
+    try:
+        points = new_local_points(pointlist)
+    except ValueError as e:
+        return Response( str(e), status=400 )
+    if not send_messages( new_local_waypoint_messages(points) ):
+        return send_queue_full()
+    if verbose: 
+        retval = 'Waypoint ENU Batch: points=%d, messages=%d\n' % (len(pointlist), len(points))
+    if curl: print_curl_format()
+    return retval
+
+
+# East/north/up meters of a geodetic position from the flight plan origin of an aircraft
+@app.route('/enu/<int:ac_id>/<lat>/<lon>/<alt>')
+def enu(ac_id, lat, lon, alt):
+    try:
+        frame = get_local_frame(ac_id)
+        east, north, up = frame.to_enu(float(lat), float(lon), float(alt))
+    except ValueError as e:
+        return Response( str(e), status=400 )
+    if curl: print_curl_format()
+    return Response( json.dumps({'east': round(float(east), 3), 'north': round(float(north), 3), 'up': round(float(up), 3)}),
+                     mimetype='application/json' )
+
+
 @app.route('/waypoint/<int:ac_id>/<int:wp_id>/<lat>/<lon>/<alt>')
 def waypoint(ac_id, wp_id, lat, lon, alt):
     retval = ''
 
-    msg = PprzMessage("ground", "MOVE_WAYPOINT")
-    msg['ac_id'] = ac_id
-    msg['wp_id'] = wp_id
-    msg['lat']   = lat
-    msg['long']  = lon
-    msg['alt']   = alt
+    if not send_message( new_waypoint_message(ac_id, wp_id, lat, lon, alt) ):
+        return send_queue_full()
     if verbose: 
-        print_ivy_trace(msg)
         retval = 'Waypoint: ac_id=%d, wp_id=%d, lat=%s, lon=%s, alt=%s\n' % (ac_id, wp_id, lat, lon, alt)
-    ivy_interface.send(msg)
     if curl: print_curl_format()
     return retval
 
@@ -730,14 +2727,11 @@ def waypoint(ac_id, wp_id, lat, lon, alt):
 def flightblock_all_aircraft(fb_id):
     retval = ''
 
-    for ac_id in aircraft_client_list:
-        msg = PprzMessage("ground", "JUMP_TO_BLOCK")
-        msg['ac_id']    = ac_id
-        msg['block_id'] = fb_id
-        if verbose: 
-            print_ivy_trace(msg)
-            retval = 'Flightblock All Aircraft: fb_id=%d\n' % (fb_id)
-        ivy_interface.send(msg)
+    msglist = [ new_flightblock_message(ac_id, fb_id) for ac_id in aircraft_view.ids ]
+    if not send_messages(msglist):
+        return send_queue_full()
+    if verbose and msglist: 
+        retval = 'Flightblock All Aircraft: fb_id=%d\n' % (fb_id)
     if curl: print_curl_format()
     return retval
 
@@ -746,16 +2740,105 @@ def flightblock_all_aircraft(fb_id):
 def flightblock(ac_id, fb_id):
     retval = ''
 
-    msg = PprzMessage("ground", "JUMP_TO_BLOCK")
-    msg['ac_id']    = ac_id
-    msg['block_id'] = fb_id
+    if not send_message( new_flightblock_message(ac_id, fb_id) ):
+        return send_queue_full()
     if verbose: 
-        print_ivy_trace(msg)
         retval = 'Flightblock: ac_id=%d, fb_id=%d\n' % (ac_id, fb_id)
-    ivy_interface.send(msg)
     if curl: print_curl_format()
     return retval
 
+
+@app.route('/flightblock/<ac_name>/<fb_name>')
+def flightblock_byname(ac_name, fb_name):
+    ac_id = aircraft_names.get(ac_name)
+    if ac_id is None:
+        return "unknown aircraft name"
+    fb_id = aircrafts[ac_id].flightplan.flightblock_index.get(fb_name)
+    if fb_id is None:
+        return "unknown flightblock name"
+    return flightblock(ac_id, fb_id)
+
+
+# Send a list of commands, e.g. [{"msg": "JUMP_TO_BLOCK", "ac_id": 215, "block_id": 3}, ...], in a single burst
+@app.route('/batch/', methods=['POST'])
+def batch():
+    retval = ''
+
+    commandlist = request.get_json(force=True, silent=True)
+    if not isinstance(commandlist, list):
+        return Response( "batch must be a json list of commands", status=400 )
+    try:
+        msglist = new_batch_messages(commandlist)
+    except ValueError as e:
+        return Response( str(e), status=400 )
+    if not send_messages(msglist):
+        return send_queue_full()
+    if verbose: 
+        retval = 'Batch: commands=%d, messages=%d\n' % (len(commandlist), len(msglist))
+    if curl: print_curl_format()
+    return retval
+
+
+@app.route('/mission/', methods=['GET', 'POST'])
+def mission_all():
+    if request.method == 'POST':
+        steplist = request.get_json(force=True, silent=True)
+        if not isinstance(steplist, list):
+            return Response( "mission must be a json list of steps", status=400 )
+        try:
+            steps = new_mission_steps(steplist)
+        except ValueError as e:
+            return Response( str(e), status=400 )
+        mission = Mission(next(mission_counter), steps)
+        with state_lock:
+            missions[mission.mission_id] = mission
+        mission.start()
+        if curl: print_curl_format()
+        return Response( json.dumps(mission.to_dict()), mimetype='application/json' )
+    if curl: print_curl_format()
+    with state_lock:
+        missionlist = list(missions.values())
+    return Response( json.dumps(sorted([ mission.to_dict() for mission in missionlist ], key=lambda m: m['id'])), mimetype='application/json' )
+
+
+@app.route('/mission/<int:mission_id>')
+def mission_status(mission_id):
+    if mission_id in missions:
+        if curl: print_curl_format()
+        return Response( json.dumps(missions[mission_id].to_dict()), mimetype='application/json' )
+    return "unknown mission id"
+
+
+@app.route('/mission/abort/<int:mission_id>')
+def mission_abort(mission_id):
+    if mission_id in missions:
+        missions[mission_id].abort()
+        if curl: print_curl_format()
+        return Response( json.dumps(missions[mission_id].to_dict()), mimetype='application/json' )
+    return "unknown mission id"
+
+
+@app.route('/api/aircraft/')
+def api_aircraft_all():
+    if curl: print_curl_format()
+    return api_response(api_aircraft_list_document())
+
+
+@app.route('/api/aircraft/<int:ac_id>')
+def api_aircraft(ac_id):
+    ac_id = int(ac_id)
+    if ac_id in aircrafts:
+        if curl: print_curl_format()
+        return api_response(api_aircraft_document(aircrafts[ac_id]))
+    return Response("unknown aircraft id", status=404)
+
+
+@app.route('/api/client/')
+def api_client():
+    if curl: print_curl_format()
+    return api_response(api_client_document())
+
+
 @app.route('/template/configuration/')
 def template_configuration():
     generate_configuration_stub()
@@ -766,101 +2849,63 @@ def template_configuration():
 def showview(name):
     view_mode   = request.args.get('view_mode',  'col')
     button_size = request.args.get('button_size', 64) 
-    return render_template(name+'.html', p_host=server_host,          p_port=server_port, 
-                            p_row_count=len(aircraft_client_list),    p_row_list=aircraft_client_list, 
-                            p_ac_color_list=ac_color_list,            p_ac_label_list=ac_label_list,
-                            p_ac_icon_list=ac_icon_list,              p_ac_tooltip_list=ac_tooltip_list,
-                            p_view_mode=view_mode,                    p_button_size=int(button_size),
-                            p_col_count=len(flightblock_client_list), p_col_list=flightblock_client_list,
-                            p_color_list=fb_color_list,               p_label_list=fb_label_list,
-                            p_icon_list=fb_icon_list,                 p_tooltip_list=fb_tooltip_list)
+    cols        = flightblock_view
+    return render_client_view(name+'.html', aircraft_view, cols,
+                              p_view_mode=view_mode, p_button_size=int(button_size), p_col_count=len(cols))
 
 
 @app.route('/show/flightblock/')
 def showflightblock():
     view_mode   = request.args.get('view_mode',   'col')
     button_size = request.args.get('button_size', 64) 
-    return render_template('flightblock.html', p_host=server_host,    p_port=server_port, 
-                            p_row_count=len(aircraft_client_list),    p_row_list=aircraft_client_list, 
-                            p_ac_color_list=ac_color_list,            p_ac_label_list=ac_label_list,
-                            p_ac_icon_list=ac_icon_list,              p_ac_tooltip_list=ac_tooltip_list,
-                            p_view_mode=view_mode,                    p_button_size=int(button_size),
-                            p_col_count=len(flightblock_client_list), p_col_list=flightblock_client_list,
-                            p_color_list=fb_color_list,               p_label_list=fb_label_list,
-                            p_icon_list=fb_icon_list,                 p_tooltip_list=fb_tooltip_list)
+    cols        = flightblock_view
+    return render_client_view('flightblock.html', aircraft_view, cols,
+                              p_view_mode=view_mode, p_button_size=int(button_size), p_col_count=len(cols))
 
 
 @app.route('/show/flightblockredux/')
 def showflightblockredux():
     view_mode   = request.args.get('view_mode',   'col')
     button_size = request.args.get('button_size', 64) 
-    layout[0].cols = int(request.args.get('cols', unicode(layout[0].cols)))
-    return render_template('flightblockredux.html', p_host=server_host,    p_port=server_port, 
-                            p_row_count=len(aircraft_client_list),    p_row_list=aircraft_client_list, 
-                            p_ac_color_list=ac_color_list,            p_ac_label_list=ac_label_list,
-                            p_ac_icon_list=ac_icon_list,              p_ac_tooltip_list=ac_tooltip_list,
-                            p_view_mode=view_mode,                    p_button_size=int(button_size),
-                            p_col_count=len(flightblock_client_list), p_col_list=flightblock_client_list,
-                            p_color_list=fb_color_list,               p_label_list=fb_label_list,
-                            p_icon_list=fb_icon_list,                 p_tooltip_list=fb_tooltip_list,
-                            p_layout_rows=layout[0].rows,             p_layout_cols=layout[0].cols )
+    layout_cols = int(request.args.get('cols', layout[0].cols))   # Per request override, the shared layout is left unchanged
+    cols        = flightblock_view
+    return render_client_view('flightblockredux.html', aircraft_view, cols,
+                              p_view_mode=view_mode, p_button_size=int(button_size), p_col_count=len(cols),
+                              p_layout_rows=layout[0].rows, p_layout_cols=layout_cols)
 
 
 @app.route('/show/guided/')
 def showguided():
     view_mode   = request.args.get('view_mode',   'col')
     button_size = request.args.get('button_size', 64) 
-    return render_template('guided.html', p_host=server_host,      p_port=server_port, 
-                            p_row_count=len(aircraft_client_list), p_row_list=aircraft_client_list,
-                            p_ac_color_list=ac_color_list,         p_ac_label_list=ac_label_list,
-                            p_ac_icon_list=ac_icon_list,           p_ac_tooltip_list=ac_tooltip_list,
-                            p_view_mode=view_mode,                 p_button_size=int(button_size),
-                            p_col_count=10, 
-                            p_color_list=gd_color_list,            p_label_list=gd_label_list,
-                            p_icon_list=gd_icon_list,              p_tooltip_list=gd_tooltip_list) 
+    return render_client_view('guided.html', aircraft_view, guided_view,
+                              p_view_mode=view_mode, p_button_size=int(button_size), p_col_count=10) 
 
 
 @app.route('/show/waypoint/')
 def showwaypoint():
     view_mode   = request.args.get('view_mode',   'col')
     button_size = request.args.get('button_size', 64) 
-    return render_template('waypoint.html', p_host=server_host,    p_port=server_port, 
-                            p_row_count=len(aircraft_client_list), p_row_list=aircraft_client_list,
-                            p_ac_color_list=ac_color_list,         p_ac_label_list=ac_label_list,
-                            p_ac_icon_list=ac_icon_list,           p_ac_tooltip_list=ac_tooltip_list,
-                            p_view_mode=view_mode,                 p_button_size=int(button_size),
-                            p_col_count=len(waypoint_client_list), p_col_list=waypoint_client_list,
-                            p_color_list=wp_color_list,            p_label_list=wp_label_list,
-                            p_icon_list=wp_icon_list,              p_tooltip_list=wp_tooltip_list) 
+    cols        = waypoint_view
+    return render_client_view('waypoint.html', aircraft_view, cols,
+                              p_view_mode=view_mode, p_button_size=int(button_size), p_col_count=len(cols)) 
 
 
 @app.route('/show/waypointhover/')
 def showwaypointhover():
     view_mode   = request.args.get('view_mode',   'col')
     button_size = request.args.get('button_size', 64) 
-    return render_template('waypointhover.html', p_host=server_host, p_port=server_port, 
-                            p_row_count=len(aircraft_client_list),   p_row_list=aircraft_client_list,
-                            p_ac_color_list=ac_color_list,           p_ac_label_list=ac_label_list,
-                            p_ac_icon_list=ac_icon_list,             p_ac_tooltip_list=ac_tooltip_list,
-                            p_view_mode=view_mode,                   p_button_size=int(button_size),
-                            p_col_count=8, 
-                            p_color_list=wp_color_list,              p_label_list=wp_label_list,
-                            p_icon_list=wp_icon_list,                p_tooltip_list=wp_tooltip_list) 
+    return render_client_view('waypointhover.html', aircraft_view, waypoint_view,
+                              p_view_mode=view_mode, p_button_size=int(button_size), p_col_count=8) 
 
 
 @app.route('/show/status/')
 def showstatus():
     view_mode   = request.args.get('view_mode',   'col')
     button_size = request.args.get('button_size', 64) 
-    return render_template('status.html', p_host=server_host,      p_port=server_port, 
-                            p_row_count=len(aircraft_client_list), p_row_list=aircraft_client_list, 
-                            p_ac_color_list=ac_color_list,         p_ac_label_list=ac_label_list,
-                            p_ac_icon_list=ac_icon_list,           p_ac_tooltip_list=ac_tooltip_list,
-                            p_view_mode=view_mode,                 p_button_size=int(button_size),
-                            p_col_count=len(status_client_list),   p_col_list=status_client_list,
-                            p_col_list_msg_name=status_client_list_msg_name, p_col_list_msg_key=status_client_list_msg_key,
-                            p_color_list=st_color_list,            p_label_list=st_label_list,
-                            p_icon_list=st_icon_list,              p_tooltip_list=st_tooltip_list)
+    cols        = status_view
+    return render_client_view('status.html', aircraft_view, cols,
+                              p_view_mode=view_mode, p_button_size=int(button_size), p_col_count=len(cols))
 
 
 @app.route('/about')
@@ -882,21 +2927,61 @@ if __name__ == '__main__':
     parser.add_argument("-g","--generate",  action="store_true", help="generate a client configuration stub")
     parser.add_argument("-c","--curl",      action="store_true", help="dump actions as curl commands")
     parser.add_argument("-s","--subscribe", action="store_true", help="subscribe to the ivy bus")
+    parser.add_argument("--subscribe_all",  action="store_true", help="with --subscribe, receive every message instead of the used ones")
     parser.add_argument("-v","--verbose",   action="store_true", help="verbose mode")
+    parser.add_argument("-t","--tick", type=float, default=stream_tick,
+                        help="status stream tick interval in seconds")
+    parser.add_argument("-d","--depth", type=int, default=history_depth,
+                        help="telemetry history depth in samples per message")
+    parser.add_argument("-m","--memory", type=int, default=history_cap,
+                        help="telemetry history memory cap in MB")
+    parser.add_argument("--separation", type=float, default=separation_monitor.minimum,
+                        help="with --subscribe, minimum separation between aircraft in meters, 0 disables the monitor")
+    parser.add_argument("-q","--queue", type=int, default=send_queue.size,
+                        help="maximum number of messages waiting to be sent on the ivy bus")
+    parser.add_argument("--guidance_rate", type=float, default=guidance_stream.rate,
+                        help="maximum streamed guided setpoints sent per second and aircraft")
+    parser.add_argument("-r","--reload", type=float, default=config_watcher.interval,
+                        help="configuration file poll interval in seconds, 0 disables the hot reload")
+    parser.add_argument("--snapshot", type=str, default=os.path.join(PPRZ_HOME, 'var', 'frc_snapshot.bin'),
+                        help="startup snapshot file, an empty name disables the snapshot")
 
     try:
         # --- Startup state initialization block
         args = parser.parse_args()
-        static_init_configuration_data()
-        static_init_client_configuration_data(args.file)
+        snapshot_loaded = args.snapshot and load_snapshot(args.snapshot, args.file)
+        if snapshot_loaded:
+            print("Loaded startup snapshot: %s" % args.snapshot)
+        else:
+            static_init_configuration_data()
+            static_init_client_configuration_data(args.file)
         if args.verbose: 
             print_aircraft_data()
         if args.generate:
             template_configuration()
             sys.exit(0)
+        for ac_id in aircraft_view.ids:   # Warm up the settings cache prior to the first mode change
+            get_auto2_index(ac_id)
+        if args.snapshot and not snapshot_loaded:
+            save_snapshot(args.snapshot, args.file)
+        warm_api_documents()   # Serve the first configuration requests from memory
+        status_stream.tick = args.tick
+        history_depth      = args.depth
+        history_cap        = args.memory
+        if args.subscribe and args.separation > 0:
+            separation_monitor.minimum = args.separation
+            separation_monitor.start()
         if args.subscribe: 
-            ivy_interface.subscribe(callback_aircraft_messages)
+            ivy_subscription.start(callback_aircraft_messages, args.subscribe_all)
+        send_queue.size    = args.queue
         ivy_interface.start()
+        send_queue.start()
+        guidance_stream.rate = args.guidance_rate
+        guidance_stream.start()
+        status_stream.start()
+        if args.reload > 0:
+            config_watcher.interval = args.reload
+            config_watcher.start(args.file)
 
         # Handle misc. command line arguments
         if args.verbose: 
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+/*
+ * Copyright (C) 2003-2016 The Paparazzi Team
+ *
+ * This file is part of paparazzi.
+ *
+ * paparazzi is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2, or (at your option)
+ * any later version.
+ *
+ * paparazzi is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with paparazzi; see the file COPYING.  If not, see
+ * <http://www.gnu.org/licenses/>.
+ */
+"""
+
+# Ivy callback microbenchmark: messages/second handled by callback_aircraft_messages, compared with
+# the previous implementation that built a new Message(PprzMessage) for every received packet.
+#
+#   usage: python test/bench_callback.py [-a AIRCRAFT] [-n MESSAGES]
+
+from __future__ import print_function
+import sys
+import time
+import argparse
+from os import path
+
+sys.path.append(path.join(path.dirname(path.abspath(__file__)), '..'))
+
+import frc
+from frc import PprzMessage
+
+
+class LegacyMessage(PprzMessage):
+    def __init__(self, class_name, name, msg):
+        super(LegacyMessage, self).__init__(class_name, name)
+        self.field_controls = {}
+        self.index          = None
+        self.last_seen      = time.time()
+        self.latest_msg     = msg
+
+def legacy_callback(messages, ac_id, msg):
+    messages[msg.name] = LegacyMessage(msg.msg_class, msg.name, msg)
+    messages[msg.name].last_seen = time.time()
+    for index in range(0, len(msg.fieldvalues)):
+        messages[msg.name].field_controls[index] = msg.get_field(index)
+
+def new_telemetry(ac_count):
+    # One ROTORCRAFT_STATUS, ROTORCRAFT_NAV_STATUS and GPS_INT message per aircraft
+    msglist = []
+    for ac_id in range(1, ac_count+1):
+        for name in ['ROTORCRAFT_STATUS', 'ROTORCRAFT_NAV_STATUS', 'GPS_INT']:
+            msg = PprzMessage("telemetry", name)
+            for fieldname in msg.fieldnames:
+                msg[fieldname] = 1
+            msglist.append( (ac_id, msg) )
+    return msglist
+
+def run(name, callback, msglist, count):
+    rounds = max(1, count // len(msglist))
+    start  = time.time()
+    for i in range(rounds):
+        for ac_id, msg in msglist:
+            callback(ac_id, msg)
+    elapsed = time.time() - start
+    print("%-8s %8d messages in %6.3f s: %10.0f messages/s" % (name, rounds*len(msglist), elapsed, rounds*len(msglist)/elapsed))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-a","--aircraft", type=int, default=5,      help="number of aircraft")
+    parser.add_argument("-n","--messages", type=int, default=200000, help="number of messages")
+    args = parser.parse_args()
+
+    msglist = new_telemetry(args.aircraft)
+    legacy  = dict( (ac_id, {}) for ac_id, msg in msglist )
+    frc.history_depth = 0   # Measure the message table update only
+    run('before', lambda ac_id, msg: legacy_callback(legacy[ac_id], ac_id, msg), msglist, args.messages)
+    run('after',  frc.callback_aircraft_messages, msglist, args.messages)
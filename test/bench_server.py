@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+"""
+/*
+ * Copyright (C) 2003-2016 The Paparazzi Team
+ *
+ * This file is part of paparazzi.
+ *
+ * paparazzi is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2, or (at your option)
+ * any later version.
+ *
+ * paparazzi is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with paparazzi; see the file COPYING.  If not, see
+ * <http://www.gnu.org/licenses/>.
+ */
+"""
+
+# Server benchmark: HTTP latency(p50/p99) and throughput of the hot routes under concurrent load, while a fake
+# ivy bus delivers synthetic telemetry for a swarm of aircraft. No Paparazzi setup or ivy bus is needed besides
+# the pprzlink python library(PAPARAZZI_SRC). The fake bus matches the ivy bindings like the real one, but does
+# not parse the messages.
+#
+#   usage: python test/bench_server.py [-a AIRCRAFT] [-t TELEMETRY] [-c CONCURRENCY] [-n REQUESTS] [--subscribe_all]
+
+from __future__ import print_function
+import re
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import argparse
+from os import path
+
+try:
+    from urllib2 import urlopen, HTTPError
+except ImportError:
+    from urllib.request import urlopen
+    from urllib.error import HTTPError
+
+sys.path.append(path.join(path.dirname(path.abspath(__file__)), '..'))
+
+import frc
+from frc import PprzMessage
+from werkzeug.serving import make_server
+from bench_startup import write_swarm_conf
+
+status_messages = ['ROTORCRAFT_STATUS', 'ROTORCRAFT_NAV_STATUS', 'GPS_INT']   # Read by the status columns
+other_messages  = ['ATTITUDE', 'ENERGY', 'IMU_GYRO_SCALED', 'IMU_ACCEL_SCALED', 'ROTORCRAFT_FP']
+
+
+class FakeIvyInterface(object):
+    # Stands in for pprzlink's IvyMessagesInterface: delivers the telemetry of every aircraft rate times per second
+    # to the bindings whose regex matches, and counts the messages sent by the server
+    def __init__(self, ac_ids, rate):
+        self.bindings  = {}
+        self.next_id   = 0
+        self.rate      = rate
+        self.sent      = 0
+        self.delivered = 0
+        self.running   = False
+        self.telemetry = []
+        for ac_id in ac_ids:
+            for name in status_messages + other_messages:
+                try:
+                    msg = PprzMessage("telemetry", name)
+                except Exception:
+                    continue   # Not in this pprzlink's messages.xml
+                for fieldname in msg.fieldnames:
+                    msg[fieldname] = 1
+                self.telemetry.append( ('%d %s 1' % (ac_id, name), ac_id, msg) )
+
+    def subscribe(self, callback, regex_or_msg='(.*)'):
+        self.next_id += 1
+        bindings = dict(self.bindings)
+        bindings[self.next_id] = (callback, re.compile(regex_or_msg))
+        self.bindings = bindings
+        return self.next_id
+
+    def unsubscribe(self, b_id):
+        bindings = dict(self.bindings)
+        del bindings[b_id]
+        self.bindings = bindings
+
+    def send(self, msg, ac_id=None):
+        self.sent += 1
+
+    def send_raw_datalink(self, msg):
+        self.sent += 1
+
+    def run(self):
+        period = 1.0 / self.rate
+        due    = time.time()
+        while self.running:
+            for line, ac_id, msg in self.telemetry:
+                for callback, regex in list(self.bindings.values()):
+                    if regex.match(line):
+                        callback(ac_id, msg)
+                        self.delivered += 1
+            due += period
+            time.sleep(max(0.0, due - time.time()))
+
+    def start(self):
+        self.running = True
+        thread = threading.Thread(target=self.run, name="FakeIvy")
+        thread.daemon = True
+        thread.start()
+
+    def shutdown(self):
+        self.running = False
+
+
+def write_client_conf(fname, ac_count):
+    with open(fname, 'w') as f:
+        f.write('<client>\n')
+        for ac in range(min(ac_count, 20)):
+            f.write('  <aircraft ac_id="%d" />\n' % (ac+1))
+        for fb in range(10):
+            f.write('  <flightblock name="Block%d" />\n' % fb)
+        for wp in range(8):
+            f.write('  <waypoint name="WP%d" />\n' % wp)
+        f.write('  <status name="AP_MODE"  msg_name="ROTORCRAFT_STATUS"     msg_key="ap_mode" />\n')
+        f.write('  <status name="VOLTAGE"  msg_name="ROTORCRAFT_STATUS"     msg_key="vsupply" />\n')
+        f.write('  <status name="NAV_STAT" msg_name="ROTORCRAFT_NAV_STATUS" msg_key="cur_block" />\n')
+        f.write('  <status name="GPS_SC"   msg_name="GPS_INT"               msg_key="numsv" />\n')
+        f.write('</client>\n')
+
+def get(url):
+    start = time.time()
+    try:
+        response = urlopen(url)
+        response.read()
+        status = response.getcode()
+    except HTTPError as e:
+        status = e.code
+    return time.time() - start, status
+
+def percentile(samples, fraction):
+    return samples[min(len(samples)-1, int(len(samples) * fraction))]
+
+def run(name, urls, concurrency, count):
+    # count requests cycling through urls, spread over concurrency client threads
+    latencies = []
+    errors    = [0]
+    lock      = threading.Lock()
+    def client(worker):
+        mine = []
+        for i in range(worker, count, concurrency):
+            latency, status = get(urls[i % len(urls)])
+            mine.append(latency)
+            if status >= 400:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(mine)
+    threads = [ threading.Thread(target=client, args=(worker,)) for worker in range(concurrency) ]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    latencies.sort()
+    print("%-12s %6d requests %4d errors  p50 %7.2f ms  p99 %7.2f ms  max %7.2f ms  %8.0f requests/s" %
+          (name, count, errors[0], percentile(latencies, 0.50)*1000.0, percentile(latencies, 0.99)*1000.0,
+           latencies[-1]*1000.0, count/elapsed))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-a","--aircraft",    type=int,   default=20,   help="number of aircraft")
+    parser.add_argument("-t","--telemetry",   type=float, default=10.0, help="telemetry rate per message and aircraft in Hz")
+    parser.add_argument("-c","--concurrency", type=int,   default=8,    help="number of concurrent clients")
+    parser.add_argument("-n","--requests",    type=int,   default=2000, help="number of requests per route")
+    parser.add_argument("--subscribe_all",    action="store_true",      help="bind every ivy message")
+    args = parser.parse_args()
+
+    conf_dir = tempfile.mkdtemp()
+    try:
+        write_swarm_conf(conf_dir, args.aircraft, 2, 20, 10)
+        write_client_conf(path.join(conf_dir, 'frc_conf.xml'), args.aircraft)
+        frc.PPRZ_SRC_CONF = conf_dir
+        frc.static_init_configuration_data()
+        frc.static_init_client_configuration_data(path.join(conf_dir, 'frc_conf.xml'))
+        frc.warm_api_documents()
+
+        ac_ids = sorted(frc.aircrafts)
+        ivy = FakeIvyInterface(ac_ids, args.telemetry)
+        frc.ivy_interface = ivy
+        frc.ivy_subscription.start(frc.callback_aircraft_messages, args.subscribe_all)
+        frc.send_queue.start()
+        frc.status_stream.start()
+        ivy.start()
+
+        server = make_server('127.0.0.1', 0, frc.app, threaded=True)
+        thread = threading.Thread(target=server.serve_forever, name="Server")
+        thread.daemon = True
+        thread.start()
+        prefix = 'http://127.0.0.1:%d' % server.server_port
+        time.sleep(1.0)   # Let every aircraft report its telemetry
+
+        print("%d aircraft, %d telemetry messages/s, %d clients" %
+              (len(ac_ids), len(ivy.telemetry) * args.telemetry, args.concurrency))
+        run('message',     [ prefix + '/message/%d' % ac_id for ac_id in ac_ids ], args.concurrency, args.requests)
+        run('messagekey',  [ prefix + '/message/%d/ROTORCRAFT_STATUS/vsupply' % ac_id for ac_id in ac_ids ],
+            args.concurrency, args.requests)
+        run('flightblock', [ prefix + '/flightblock/%d/%d' % (ac_id, ac_id % 10) for ac_id in ac_ids ],
+            args.concurrency, args.requests)
+        run('showstatus',  [ prefix + '/show/status/' ], args.concurrency, args.requests)
+        print("telemetry delivered %d, ivy messages sent %d" % (ivy.delivered, ivy.sent))
+        ivy.shutdown()
+        server.shutdown()
+    finally:
+        shutil.rmtree(conf_dir)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+/*
+ * Copyright (C) 2003-2016 The Paparazzi Team
+ *
+ * This file is part of paparazzi.
+ *
+ * paparazzi is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2, or (at your option)
+ * any later version.
+ *
+ * paparazzi is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with paparazzi; see the file COPYING.  If not, see
+ * <http://www.gnu.org/licenses/>.
+ */
+"""
+
+# Startup benchmark: time taken by static_init_configuration_data on a synthetic swarm conf.xml, compared with
+# the previous implementation that parsed the flight plan and built waypoint/flightblock objects per aircraft,
+# and with loading the startup snapshot.
+#
+#   usage: python test/bench_startup.py [-a AIRCRAFT] [-p FLIGHTPLANS] [-w WAYPOINTS] [-b BLOCKS] [-r ROUNDS]
+
+from __future__ import print_function
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+from os import path
+
+sys.path.append(path.join(path.dirname(path.abspath(__file__)), '..'))
+
+import frc
+from frc import ET, Waypoint, Flightblock
+
+
+def write_swarm_conf(conf_dir, ac_count, fp_count, wp_count, block_count):
+    os.mkdir(path.join(conf_dir, 'flight_plans'))
+    for fp in range(fp_count):
+        with open(path.join(conf_dir, 'flight_plans', 'swarm_%d.xml' % fp), 'w') as f:
+            f.write('<flight_plan name="swarm_%d" lat0="45.5642" lon0="-122.6222" alt="61">\n  <waypoints>\n' % fp)
+            for wp in range(wp_count):
+                f.write('    <waypoint name="WP%d" x="%.1f" y="%.1f"/>\n' % (wp, wp*10.0, wp*-5.0))
+            f.write('  </waypoints>\n  <blocks>\n')
+            for block in range(block_count):
+                f.write('    <block name="Block%d">\n      <stay wp="WP0"/>\n    </block>\n' % block)
+            f.write('  </blocks>\n</flight_plan>\n')
+    with open(path.join(conf_dir, 'conf.xml'), 'w') as f:
+        f.write('<conf>\n')
+        for ac in range(ac_count):
+            f.write('  <aircraft name="Swarm_%d" ac_id="%d" airframe="airframes/swarm.xml" flight_plan="flight_plans/swarm_%d.xml" gui_color="red"/>\n'
+                    % (ac, ac+1, ac % fp_count))
+        f.write('</conf>\n')
+
+def legacy_static_init(conf_dir):
+    aircrafts = {}
+    root = ET.parse(path.join(conf_dir, 'conf.xml')).getroot()
+    for aircraft in root.findall('aircraft'):
+        waypoints    = { 0: Waypoint(0, "dummy", "42.0", "42.0") }
+        flightblocks = {}
+        fproot = ET.parse(path.join(conf_dir, aircraft.get('flight_plan')), ET.XMLParser(recover=True)).getroot()
+        for idx, waypoint in enumerate(fproot.iter('waypoint')):
+            waypoints[idx+1] = Waypoint(idx+1, waypoint.get('name'), waypoint.get('x'), waypoint.get('y'))
+        for idx, block in enumerate(fproot.iter('block')):
+            flightblocks[idx] = Flightblock(idx, block.get('name'))
+        aircrafts[int(aircraft.get('ac_id'))] = (waypoints, flightblocks)
+    return aircrafts
+
+def shared_static_init(conf_dir):
+    frc.aircrafts = {}
+    frc.static_init_configuration_data()
+    return frc.aircrafts
+
+def run(name, init, conf_dir, rounds):
+    start = time.time()
+    for i in range(rounds):
+        init(conf_dir)
+    elapsed = (time.time() - start) / rounds
+    print("%-8s %8.1f ms per startup" % (name, elapsed*1000.0))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-a","--aircraft",    type=int, default=100, help="number of aircraft")
+    parser.add_argument("-p","--flightplans", type=int, default=2,   help="number of distinct flight plans")
+    parser.add_argument("-w","--waypoints",   type=int, default=50,  help="waypoints per flight plan")
+    parser.add_argument("-b","--blocks",      type=int, default=40,  help="flight blocks per flight plan")
+    parser.add_argument("-r","--rounds",      type=int, default=10,  help="number of startups to average")
+    args = parser.parse_args()
+
+    conf_dir = tempfile.mkdtemp()
+    try:
+        write_swarm_conf(conf_dir, args.aircraft, args.flightplans, args.waypoints, args.blocks)
+        frc.PPRZ_SRC_CONF = conf_dir
+        run('before', legacy_static_init, conf_dir, args.rounds)
+        run('after',  shared_static_init, conf_dir, args.rounds)
+        snapshot_file = path.join(conf_dir, 'frc_snapshot.bin')
+        frc.save_snapshot(snapshot_file, path.join(conf_dir, 'conf.xml'))
+        run('snapshot', lambda conf_dir: frc.load_snapshot(snapshot_file, path.join(conf_dir, 'conf.xml')), conf_dir, args.rounds)
+        acs = frc.aircrafts
+        print("%d aircraft share %d flight plans(%d waypoint tables before)" %
+              (len(acs), len(set(id(acs[ac_id].flightplan) for ac_id in acs)), len(acs)))
+    finally:
+        shutil.rmtree(conf_dir)
@@ -0,0 +1,16 @@
+#!/bin/bash
+
+# Upload a mission to the server side sequencer and poll its state until it completes.
+# usage: fly_mission.sh [mission.json]
+
+IP=127.0.0.1
+PORT=5000
+MISSION=${1:-fly_mission.json}
+
+ID=$(curl -s -X POST --data-binary @$MISSION http://$IP:$PORT/mission/ | sed 's/.*"id": \([0-9]*\).*/\1/')
+
+while curl -s http://$IP:$PORT/mission/$ID | grep -q '"running"'
+do
+    sleep 1
+done
+curl http://$IP:$PORT/mission/$ID
@@ -62,3 +62,33 @@ curl $IP_CMD_PREFIX/flightblock/217/33
 curl $IP_CMD_PREFIX/flightblock/218/33
 curl $IP_CMD_PREFIX/flightblock/33
 
+curl -m 2 $IP_CMD_PREFIX/stream/status/
+curl -X POST -d '[{"msg": "JUMP_TO_BLOCK", "ac_id": 217, "block_id": 3}, {"msg": "DL_SETTING", "ac_id": 218, "value": 19}]' $IP_CMD_PREFIX/batch/
+curl -X POST -d '[{"send": [{"msg": "JUMP_TO_BLOCK", "ac_id": 217, "block_id": 3}]}, {"sleep": 1}]' $IP_CMD_PREFIX/mission/
+curl $IP_CMD_PREFIX/mission/
+curl $IP_CMD_PREFIX/mission/1
+curl $IP_CMD_PREFIX/mission/abort/1
+curl $IP_CMD_PREFIX/history/217/ROTORCRAFT_STATUS/vsupply
+curl $IP_CMD_PREFIX/history/217/ROTORCRAFT_STATUS/vsupply?since=0
+curl $IP_CMD_PREFIX/health/
+curl $IP_CMD_PREFIX/health/217
+curl $IP_CMD_PREFIX/api/aircraft/
+curl $IP_CMD_PREFIX/api/aircraft/217
+curl --compressed $IP_CMD_PREFIX/api/client/
+curl $IP_CMD_PREFIX/aircraft/client/add/Quad_A
+curl $IP_CMD_PREFIX/flightblock/client/add/Standby
+curl $IP_CMD_PREFIX/waypoint/client/add/p1
+curl $IP_CMD_PREFIX/flightblock/Quad_A/Standby
+curl $IP_CMD_PREFIX/sendqueue/
+curl -X POST -d '{"ac_id": 217, "flags": 0, "x": 0.5, "y": 0.0, "z": 0.0, "yaw": 0.0}' $IP_CMD_PREFIX/guidance/stream/
+curl $IP_CMD_PREFIX/guidance/stream/
+curl $IP_CMD_PREFIX/subscription/
+curl $IP_CMD_PREFIX/subscription/add/ENERGY
+curl "$IP_CMD_PREFIX/waypoint/formation/grid/8/45.5642/-122.6222/61.0?spacing=10"
+curl $IP_CMD_PREFIX/waypoint/enu/217/8/10.0/-5.0/20.0
+curl -X POST -d '[{"ac_id": 217, "wp_id": 8, "east": 10.0, "north": -5.0, "up": 20.0}]' $IP_CMD_PREFIX/waypoint/enu/
+curl $IP_CMD_PREFIX/enu/217/45.5642/-122.6222/61.0
+curl $IP_CMD_PREFIX/separation/
+curl $IP_CMD_PREFIX/rules/
+curl $IP_CMD_PREFIX/latency/
+curl $IP_CMD_PREFIX/latency/217
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+/*
+ * Copyright (C) 2003-2016 The Paparazzi Team
+ *
+ * This file is part of paparazzi.
+ *
+ * paparazzi is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2, or (at your option)
+ * any later version.
+ *
+ * paparazzi is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with paparazzi; see the file COPYING.  If not, see
+ * <http://www.gnu.org/licenses/>.
+ */
+"""
+
+# Status stream test: reads the first server-sent event of /stream/status/ and checks that it is a full frame
+# with the current cells and stale flags. Needs the pprzlink python library(PAPARAZZI_SRC), no ivy bus.
+#
+#   usage: python test/stream_test.py
+
+from __future__ import print_function
+import sys
+import json
+from os import path
+
+sys.path.append(path.join(path.dirname(path.abspath(__file__)), '..'))
+
+import frc
+
+
+def first_frame(client):
+    response = client.get('/stream/status/', buffered=False)
+    try:
+        chunk = next(iter(response.response))
+    finally:
+        response.close()
+    if not isinstance(chunk, str):
+        chunk = chunk.decode('utf-8')
+    return chunk
+
+
+if __name__ == '__main__':
+    stream = frc.status_stream
+    with stream.condition:
+        stream.values[(1, 'AP_MODE')] = '3'
+        stream.values[(2, 'AP_MODE')] = '1'
+        stream.stale[(2, 'AP_MODE')]  = True
+
+    frame = first_frame(frc.app.test_client())
+    if not frame.startswith('data: ') or not frame.endswith('\n\n'):
+        sys.exit("first frame is not a server-sent event: %r" % frame)
+    data = json.loads(frame[len('data: '):])
+    if sorted(data['cells']) != [[1, 'AP_MODE', '3'], [2, 'AP_MODE', '1']]:
+        sys.exit("first frame cells: %r" % data['cells'])
+    if data['stale'] != [[2, 'AP_MODE', True]]:
+        sys.exit("first frame stale flags: %r" % data['stale'])
+    print("status stream first frame ok")